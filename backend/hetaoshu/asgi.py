@@ -0,0 +1,31 @@
+"""ASGI config for hetaoshu project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+/api/events/ 的SSE长连接由 posts.events.sse_application 直接处理，其余请求交给Django；
+热点读接口默认使用异步视图（ASYNC_VIEWS）。
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hetaoshu.settings')
+# 热点读接口使用异步视图，见posts/async_views.py
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+# 未启用连接池时不保持数据库连接，见settings.py中的DATABASES
+os.environ['ASGI_SERVER'] = 'True'
+
+django_application = get_asgi_application()
+
+# 需在Django初始化之后导入
+from posts.events import EVENTS_PATH, sse_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        await sse_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
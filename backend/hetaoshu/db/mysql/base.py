@@ -0,0 +1,6 @@
+from django.db.backends.mysql import base
+from hetaoshu.db.pool import PooledConnectionMixin
+from hetaoshu.db.timing import ConnectionTimingMixin
+
+class DatabaseWrapper(ConnectionTimingMixin, PooledConnectionMixin, base.DatabaseWrapper):
+    """在Django自带MySQL后端的基础上增加连接耗时统计和可选的连接池"""
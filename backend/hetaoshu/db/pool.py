@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from django.db import OperationalError
+
+class ConnectionPool:
+    """进程内的数据库连接池，供多线程或异步worker共享
+
+    连接数不超过size；借出前检查连接是否可用，超过recycle秒的连接会被关闭重建；
+    连接全部借出时最多等待timeout秒。
+    """
+
+    def __init__(self, size, timeout=10, recycle=3600):
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.condition = threading.Condition()
+        # 空闲连接，后进先出，优先使用最近用过的连接
+        self.idle = []
+        # 已打开连接的创建时间，按id(连接)记录
+        self.created_at = {}
+        self.opened = 0
+
+    def acquire(self, connect, check):
+        """借出一个连接，没有空闲连接时调用connect()新建，check(conn)失败时抛出异常"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self.condition:
+                while not self.idle and self.opened >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise OperationalError(f'数据库连接池已满（{self.size}个连接），等待超时')
+                    self.condition.wait(remaining)
+                if not self.idle:
+                    self.opened += 1
+                    break
+                conn = self.idle.pop()
+                expired = time.monotonic() - self.created_at[id(conn)] >= self.recycle
+            # 在锁外检查连接，避免一次网络往返阻塞其他线程
+            if not expired and self._usable(conn, check):
+                return conn
+            with self.condition:
+                self._discard(conn)
+                self.condition.notify()
+        try:
+            conn = connect()
+        except Exception:
+            with self.condition:
+                self.opened -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.created_at[id(conn)] = time.monotonic()
+        return conn
+
+    def release(self, conn, discard=False):
+        """归还连接，未提交的事务会被回滚；出错的连接直接关闭"""
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        with self.condition:
+            if discard:
+                self._discard(conn)
+            else:
+                self.idle.append(conn)
+            self.condition.notify()
+
+    def _usable(self, conn, check):
+        try:
+            check(conn)
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, conn):
+        self.opened -= 1
+        self.created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(alias, settings_dict):
+    """按数据库别名获取连接池，fork出的子进程中重新创建"""
+    key = (alias, os.getpid())
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                settings_dict['POOL_SIZE'],
+                timeout=settings_dict.get('POOL_TIMEOUT', 10),
+                recycle=settings_dict.get('POOL_RECYCLE', 3600),
+            )
+        return pool
+
+class PooledConnectionMixin:
+    """DATABASES中POOL_SIZE大于0时，从连接池借出连接，close时归还而不是断开
+
+    需要配合CONN_MAX_AGE=0使用，使每个请求结束时连接归还连接池。
+    """
+
+    @property
+    def pool(self):
+        if not self.settings_dict.get('POOL_SIZE'):
+            return None
+        return get_pool(self.alias, self.settings_dict)
+
+    def check_pooled_connection(self, conn):
+        conn.ping()
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        parent = super()
+        return pool.acquire(lambda: parent.get_new_connection(conn_params), self.check_pooled_connection)
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            # 执行出错且未恢复的连接不再放回连接池
+            pool.release(self.connection, discard=self.errors_occurred or self.in_atomic_block)
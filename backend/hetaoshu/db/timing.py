@@ -0,0 +1,44 @@
+import time
+from contextvars import ContextVar
+
+# 当前请求的统计值，由 hetaoshu.middleware.DatabaseConnectionTimingMiddleware 在请求开始时设置；
+# 保存在ContextVar中，ASGI下视图通过sync_to_async在其他线程执行的查询也计入同一个请求
+_current_stats = ContextVar('connection_stats', default=None)
+
+def _record(kind, duration):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats[f'{kind}_count'] += 1
+        stats[f'{kind}_time'] += duration
+
+class ConnectionTimingMixin:
+    """记录数据库连接的建立次数和耗时，以及复用连接前健康检查的耗时，计入当前请求的统计值"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _record('connect', time.perf_counter() - start)
+
+    def close_if_health_check_failed(self):
+        # 与父类相同的条件，只统计真正执行了检查的情况
+        if self.connection is None or not self.health_check_enabled or self.health_check_done:
+            return super().close_if_health_check_failed()
+        start = time.perf_counter()
+        try:
+            super().close_if_health_check_failed()
+        finally:
+            _record('health_check', time.perf_counter() - start)
+
+def _empty_stats():
+    return {'connect_count': 0, 'connect_time': 0.0, 'health_check_count': 0, 'health_check_time': 0.0}
+
+def reset_connection_stats():
+    """开始统计当前请求"""
+    _current_stats.set(_empty_stats())
+
+def connection_stats():
+    """当前请求所有数据库连接的统计值，时间单位为秒"""
+    stats = _current_stats.get()
+    return dict(stats) if stats is not None else _empty_stats()
@@ -0,0 +1,96 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+class QueryBudgetExceeded(Exception):
+    """请求的SQL查询数超过视图声明的预算，仅在REQUEST_METRICS_STRICT开启时抛出"""
+
+def query_budget(limit):
+    """声明视图每个请求最多执行的SQL查询数，可用于函数视图和视图类
+
+    视图集可以改为声明 query_budgets = {'list': 3, ...}，按action分别设置预算。
+    """
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+def get_query_budget(view_func, request):
+    """按 函数视图属性 > 视图集query_budgets[action] > 视图类query_budget 的顺序查找预算"""
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is not None:
+        return budget
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return None
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower())
+    budgets = getattr(view_class, 'query_budgets', None) or {}
+    if action in budgets:
+        return budgets[action]
+    return getattr(view_class, 'query_budget', None)
+
+# 当前请求的QueryCounter，由 hetaoshu.middleware.RequestMetricsMiddleware 设置；
+# 保存在ContextVar中，ASGI下视图通过sync_to_async在其他线程执行的查询也计入同一个请求
+_current_counter = ContextVar('query_counter', default=None)
+
+class QueryCounter:
+    """统计查询次数和SQL耗时，以及序列化器的耗时（见serializer_timing）"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.serializer_duration = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+@contextmanager
+def serializer_timing():
+    """把其中的耗时计入当前请求的序列化耗时，扣除其中的SQL耗时；嵌套使用时只计最外层"""
+    counter = _current_counter.get()
+    if counter is None:
+        yield
+        return
+    counter.serializer_depth += 1
+    start, db_start = time.perf_counter(), counter.duration
+    try:
+        yield
+    finally:
+        counter.serializer_depth -= 1
+        if not counter.serializer_depth:
+            counter.serializer_duration += time.perf_counter() - start - (counter.duration - db_start)
+
+def activate_query_counter(counter):
+    """之后当前请求（上下文）中的查询都计入counter，返回传给deactivate_query_counter的token"""
+    return _current_counter.set(counter)
+
+def deactivate_query_counter(token):
+    _current_counter.reset(token)
+
+def count_queries(execute, sql, params, many, context):
+    """安装在每个数据库连接上的execute_wrapper，把查询计入当前请求的QueryCounter"""
+    counter = _current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+def install_query_counter(sender, connection, **kwargs):
+    # 放在最前面，不影响其他代码用connection.execute_wrapper()临时添加和移除的wrapper
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_queries)
+
+def install_query_counters():
+    """给当前线程已建立的连接安装count_queries，之后新建立的连接由connection_created信号安装"""
+    for connection in connections.all(initialized_only=True):
+        install_query_counter(None, connection)
+
+connection_created.connect(install_query_counter, dispatch_uid='hetaoshu.metrics.install_query_counter')
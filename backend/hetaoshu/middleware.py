@@ -0,0 +1,249 @@
+import gzip
+import json
+import logging
+import time
+import types
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from hetaoshu.db.timing import connection_stats, reset_connection_stats
+from hetaoshu.metrics import (
+    QueryBudgetExceeded, QueryCounter, activate_query_counter, deactivate_query_counter, get_query_budget,
+    install_query_counters,
+)
+
+try:
+    import brotli
+except ImportError:  # 未安装brotli时只支持gzip
+    brotli = None
+
+logger = logging.getLogger('hetaoshu.db')
+metrics_logger = logging.getLogger('hetaoshu.metrics')
+
+def add_server_timing(response, name, duration=None, description=None):
+    """向响应追加一项Server-Timing指标，duration单位为秒"""
+    entry = name
+    if duration is not None:
+        entry += f';dur={duration * 1000:.2f}'
+    if description:
+        entry += f';desc="{description}"'
+    existing = response.get('Server-Timing')
+    response['Server-Timing'] = f'{existing}, {entry}' if existing else entry
+
+def _as_coroutine(hook):
+    # 仍绑定到中间件实例，Django在报错信息中会用到__self__
+    async def wrapper(self, *args):
+        return hook(*args)
+    return types.MethodType(wrapper, hook.__self__)
+
+class HookMiddleware:
+    """同时支持WSGI和ASGI的中间件基类，子类实现before(request)和after(request, response, state)
+
+    before的返回值作为state传给after。ASGI下调用链中的中间件都支持异步时，
+    请求不会为了经过中间件而占用线程；process_view等钩子也随之改为协程函数，
+    否则Django会把它们放到线程中执行。钩子和before、after中不能访问数据库。
+    """
+    sync_capable = True
+    async_capable = True
+    hooks = ('process_view', 'process_template_response')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            for name in self.hooks:
+                hook = getattr(self, name, None)
+                if hook is not None:
+                    setattr(self, name, _as_coroutine(hook))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.before(request)
+        return self.after(request, self.get_response(request), state)
+
+    async def __acall__(self, request):
+        state = self.before(request)
+        return self.after(request, await self.get_response(request), state)
+
+    def before(self, request):
+        return None
+
+    def after(self, request, response, state):
+        return response
+
+class DatabaseConnectionTimingMiddleware(HookMiddleware):
+    """在Server-Timing响应头中返回本次请求建立数据库连接和健康检查的耗时
+
+    db-connect 新建连接（含TCP握手、认证和会话初始化）的耗时，复用已有连接时为0；
+    db-health  复用连接前健康检查的耗时
+    与RequestMetricsMiddleware相同，REQUEST_METRICS_ENABLED开启时才生效
+    """
+
+    def before(self, request):
+        if not settings.REQUEST_METRICS_ENABLED:
+            return False
+        reset_connection_stats()
+        return True
+
+    def after(self, request, response, state):
+        if not state:
+            return response
+        stats = connection_stats()
+        add_server_timing(response, 'db-connect', stats['connect_time'], f'{stats["connect_count"]} connect')
+        if stats['health_check_count']:
+            add_server_timing(response, 'db-health', stats['health_check_time'])
+        logger.debug(
+            '%s %s db_connect_count=%d db_connect_ms=%.2f db_health_ms=%.2f',
+            request.method, request.path, stats['connect_count'],
+            stats['connect_time'] * 1000, stats['health_check_time'] * 1000,
+        )
+        return response
+
+class RequestMetricsMiddleware(HookMiddleware):
+    """记录每个请求的SQL查询数和耗时、视图耗时、渲染耗时和响应大小
+
+    REQUEST_METRICS_ENABLED开启时生效，结果写入Server-Timing响应头和hetaoshu.metrics日志（每行一个JSON）：
+    db      SQL查询总耗时，desc为查询次数
+    app     视图耗时减去其中的SQL和序列化耗时
+    serializer  序列化器（serializer.data）耗时，不含其中的SQL，见hetaoshu.metrics.serializer_timing
+    render  响应渲染（JSON编码）耗时
+    total   整个请求的耗时
+    size    响应体字节数
+    查询数超过视图声明的预算（见hetaoshu.metrics.query_budget）时记录警告，
+    REQUEST_METRICS_STRICT开启时抛出QueryBudgetExceeded，测试中可借此发现查询数退化。
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        install_query_counters()
+
+    def before(self, request):
+        if not settings.REQUEST_METRICS_ENABLED:
+            return None
+        counter = QueryCounter()
+        request._metrics = {
+            'counter': counter, 'budget': None, 'view': None,
+            'view_start': None, 'view_end': None, 'view_db': 0.0, 'view_serializer': 0.0,
+        }
+        return activate_query_counter(counter), time.perf_counter()
+
+    def after(self, request, response, state):
+        if state is None:
+            return response
+        token, start = state
+        end = time.perf_counter()
+        deactivate_query_counter(token)
+        self.report(request, response, request._metrics, start, end)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = getattr(request, '_metrics', None)
+        if metrics is not None:
+            metrics['budget'] = get_query_budget(view_func, request)
+            metrics['view'] = f'{view_func.__module__}.{view_func.__name__}'
+            metrics['view_start'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF的Response在此之后才渲染，用于区分视图耗时和渲染耗时
+        metrics = getattr(request, '_metrics', None)
+        if metrics is not None:
+            metrics['view_end'] = time.perf_counter()
+            metrics['view_db'] = metrics['counter'].duration
+            metrics['view_serializer'] = metrics['counter'].serializer_duration
+        return response
+
+    def report(self, request, response, metrics, start, end):
+        counter = metrics['counter']
+        view_start = metrics['view_start'] or start
+        view_end = metrics['view_end'] or end
+        view_db = metrics['view_db'] if metrics['view_end'] else counter.duration
+        serializer = metrics['view_serializer'] if metrics['view_end'] else counter.serializer_duration
+        app = max(view_end - view_start - view_db - serializer, 0.0)
+        render = end - metrics['view_end'] if metrics['view_end'] else 0.0
+        size = None if response.streaming else len(response.content)
+
+        add_server_timing(response, 'db', counter.duration, f'{counter.count} queries')
+        add_server_timing(response, 'app', app)
+        add_server_timing(response, 'serializer', serializer)
+        add_server_timing(response, 'render', render)
+        add_server_timing(response, 'total', end - start)
+        if size is not None:
+            add_server_timing(response, 'size', description=str(size))
+        metrics_logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': metrics['view'],
+            'status': response.status_code,
+            'queries': counter.count,
+            'query_budget': metrics['budget'],
+            'db_ms': round(counter.duration * 1000, 2),
+            'app_ms': round(app * 1000, 2),
+            'serializer_ms': round(serializer * 1000, 2),
+            'render_ms': round(render * 1000, 2),
+            'total_ms': round((end - start) * 1000, 2),
+            'size': size,
+        }, ensure_ascii=False))
+
+        budget = metrics['budget']
+        if budget is not None and counter.count > budget:
+            message = f'{request.method} {request.path} 执行了{counter.count}次查询，超过预算{budget}次'
+            metrics_logger.warning(message)
+            if settings.REQUEST_METRICS_STRICT:
+                raise QueryBudgetExceeded(message)
+
+def accepted_encodings(header):
+    """解析Accept-Encoding，返回客户端接受的编码集合（q=0表示不接受）"""
+    encodings = set()
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            encodings.add(name.strip().lower())
+    return encodings
+
+class CompressionMiddleware(HookMiddleware):
+    """按Accept-Encoding压缩较大的JSON和文本响应，优先使用brotli（已安装时），其次gzip
+
+    COMPRESSION_MIN_SIZE 小于该字节数的响应不压缩
+    """
+    compressible_types = ('application/json', 'text/')
+
+    def after(self, request, response, state):
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or response.status_code not in (200, 201)
+            or not response.get('Content-Type', '').startswith(self.compressible_types)
+        ):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in encodings:
+            content = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+            encoding = 'br'
+        elif 'gzip' in encodings:
+            content = gzip.compress(response.content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+            encoding = 'gzip'
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        # 压缩后的内容与原内容不再逐字节相同，强ETag改为弱ETag
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,20 @@
+from django.core.exceptions import RequestDataTooBig
+from rest_framework import exceptions, status
+from rest_framework.parsers import MultiPartParser
+
+class UploadTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = '上传内容超过大小限制'
+    default_code = 'upload_too_large'
+
+class LimitedMultiPartParser(MultiPartParser):
+    """与DRF的MultiPartParser相同，上传内容超过大小限制时返回413和JSON格式的错误信息
+
+    RequestDataTooBig不是APIException，不经过DRF的异常处理，客户端会收到Django的HTML错误页面。
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return super().parse(stream, media_type, parser_context)
+        except RequestDataTooBig as e:
+            raise UploadTooLarge(str(e))
@@ -0,0 +1,26 @@
+from rest_framework.utils import encoders
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # 未安装orjson时使用DRF自带的标准库实现
+    orjson = None
+
+_encoder = encoders.JSONEncoder()
+
+def _default(obj):
+    # orjson不支持的类型（Decimal、惰性翻译字符串等）交给DRF的编码器处理
+    return _encoder.default(obj)
+
+class FastJSONRenderer(JSONRenderer):
+    """使用orjson编码的JSON渲染器，输出与DRF默认的紧凑、非ASCII转义格式一致
+
+    需要缩进（可浏览API等）或未安装orjson时退回DRF的标准库实现。
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        # 与DRF一致，转义U+2028和U+2029，使输出可以直接嵌入JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
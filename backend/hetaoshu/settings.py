@@ -31,6 +31,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'hetaoshu.middleware.CompressionMiddleware',
+    'hetaoshu.middleware.RequestMetricsMiddleware',
+    'hetaoshu.middleware.DatabaseConnectionTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -63,18 +66,38 @@ WSGI_APPLICATION = 'hetaoshu.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        # Django自带MySQL后端，增加了连接耗时统计和可选的连接池
+        'ENGINE': 'hetaoshu.db.mysql',
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('DB_USER'),
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # 请求结束后保持连接的秒数，0为每个请求后断开，复用前检查连接是否可用
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True').lower() == 'true',
+        # 连接池大小，大于0时启用进程内连接池，适用于多线程或异步worker
+        'POOL_SIZE': int(os.getenv('DB_POOL_SIZE', 0)),
+        'POOL_TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'POOL_RECYCLE': int(os.getenv('DB_POOL_RECYCLE', 3600)),
         'OPTIONS': {
             'charset': 'utf8mb4',
         }
     }
 }
 
+# 通过hetaoshu/asgi.py启动（uvicorn、events服务）时为True
+ASGI_SERVER = os.getenv('ASGI_SERVER', 'False').lower() == 'true'
+
+if DATABASES['default']['POOL_SIZE']:
+    # 使用连接池时每个请求结束都把连接归还连接池，由连接池负责复用
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+elif ASGI_SERVER:
+    # ASGI下同步的数据库操作在sync_to_async的线程中执行，持久连接属于这些线程，不会在请求结束时复用或回收，
+    # 会一直占用到线程退出，线程数多时可能超过MySQL的连接数上限；未启用连接池时忽略DB_CONN_MAX_AGE，每个请求后断开。
+    # ASGI部署建议设置DB_POOL_SIZE，复用连接
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -109,16 +132,32 @@ AUTH_USER_MODEL = 'users.User'
 # REST Framework设置
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        # 与TokenAuthentication相同，缓存令牌查询结果
+        'users.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        # 上传内容超过大小限制时返回413和JSON格式的错误信息
+        'hetaoshu.parsers.LimitedMultiPartParser',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        # 安装了orjson时使用orjson编码，否则与DRF默认的JSONRenderer相同
+        'hetaoshu.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
 }
 
+# 令牌认证缓存：缓存时间（秒）和每个进程内LRU的条目数，登出、修改密码、修改用户信息时立即失效
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 60))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+
 # CORS设置
 CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS').split(',')
 
@@ -128,11 +167,84 @@ EMAIL_HOST = os.getenv('EMAIL_HOST')
 EMAIL_PORT = int(os.getenv('EMAIL_PORT'))
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True').lower() == 'true'
+EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', 10))
+# 后台发送队列：临时错误的重试次数、首次重试间隔（秒，之后按指数增加）、空闲多久断开SMTP连接（秒）
+EMAIL_SEND_MAX_RETRIES = int(os.getenv('EMAIL_SEND_MAX_RETRIES', 3))
+EMAIL_SEND_RETRY_DELAY = float(os.getenv('EMAIL_SEND_RETRY_DELAY', 2))
+EMAIL_CONNECTION_IDLE_TIMEOUT = int(os.getenv('EMAIL_CONNECTION_IDLE_TIMEOUT', 60))
+
+# 文件上传：按块写入临时文件，不在内存中缓存整个上传文件
+FILE_UPLOAD_HANDLERS = ['hetaoshu.upload_handlers.LimitedTemporaryFileUploadHandler']
+FILE_UPLOAD_TEMP_DIR = os.getenv('FILE_UPLOAD_TEMP_DIR') or None
+# 文件上传大小限制：单个文件20M，整个请求60M，在接收过程中检查
+UPLOAD_MAX_FILE_SIZE = int(os.getenv('UPLOAD_MAX_FILE_SIZE', 20971520))  # 20M
+UPLOAD_MAX_REQUEST_SIZE = int(os.getenv('UPLOAD_MAX_REQUEST_SIZE', 62914560))  # 60M
+# 非文件字段的大小限制（文件内容不计入）
+DATA_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5M
+
+# 缓存设置，默认使用文件缓存，使多个进程（gunicorn worker、events服务）共享同一份缓存。
+# 文件缓存每次写入都会列出缓存目录，条目数超过MAX_ENTRIES时随机删除1/CULL_FREQUENCY的文件，
+# 主题版本号、令牌版本号也可能被删除，删除后会生成新的版本号，只是相应的缓存全部失效。
+# 访问量较大时建议改用Redis（django.core.cache.backends.redis.RedisCache）或memcached，
+# 通过CACHE_BACKEND和CACHE_LOCATION配置
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+        # 未指定过期时间的条目的默认过期时间（秒）
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 20000)),
+        },
+    }
+}
 
-# 文件上传大小限制 (62914560k = 60M)
-DATA_UPLOAD_MAX_MEMORY_SIZE = 62914560  # 60M
-FILE_UPLOAD_MAX_MEMORY_SIZE = 62914560  # 60M
+# 回复树缓存时间（秒），帖子写入时会通过版本号立即失效
+REPLY_TREE_CACHE_TIMEOUT = int(os.getenv('REPLY_TREE_CACHE_TIMEOUT', 3600))
 
 # RSA密钥路径配置
 RSA_PUBLIC_KEY_PATH = os.path.join(BASE_DIR, 'keys', 'public.pem')
 RSA_PRIVATE_KEY_PATH = os.path.join(BASE_DIR, 'keys', 'private.pem')
+# 密钥在每个进程内只加载一次；开启后密钥文件修改时间变化时自动重新加载，便于轮换
+RSA_KEY_RELOAD = os.getenv('RSA_KEY_RELOAD', 'True').lower() == 'true'
+# RSA解密后端：auto（优先cryptography，未安装时回退到rsa）、cryptography 或 rsa
+RSA_DECRYPT_BACKEND = os.getenv('RSA_DECRYPT_BACKEND', 'auto')
+
+# 响应压缩：大于COMPRESSION_MIN_SIZE字节的JSON和文本响应按Accept-Encoding使用brotli或gzip压缩
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5))
+
+# 热点读接口（主题信息流、帖子详情、回复树、消息）使用异步视图，hetaoshu/asgi.py默认开启，WSGI部署时保持关闭
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False').lower() == 'true'
+
+# 回复通知推送（SSE，仅ASGI部署可用，见hetaoshu/asgi.py）
+# 轮询其他进程写入的事件的间隔（秒）及向前多取的时间窗口（秒）
+EVENTS_POLL_INTERVAL = float(os.getenv('EVENTS_POLL_INTERVAL', 1))
+EVENTS_POLL_LOOKBACK = float(os.getenv('EVENTS_POLL_LOOKBACK', 5))
+# 空闲连接的心跳间隔（秒），需小于代理的读超时
+EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', 25))
+# 浏览器断线后的重连等待时间（毫秒）
+EVENTS_RETRY = int(os.getenv('EVENTS_RETRY', 5000))
+# 连接凭证的有效期（秒），凭证写入CACHES，需要与events服务共享缓存
+EVENTS_TICKET_TIMEOUT = int(os.getenv('EVENTS_TICKET_TIMEOUT', 30))
+# 事件保留时间及清理间隔（秒），超过保留时间的事件不再补发
+EVENTS_RETENTION = int(os.getenv('EVENTS_RETENTION', 86400))
+EVENTS_PRUNE_INTERVAL = int(os.getenv('EVENTS_PRUNE_INTERVAL', 600))
+
+# 请求指标：SQL查询数和耗时、视图耗时、渲染耗时、响应大小，写入Server-Timing响应头和hetaoshu.metrics日志
+REQUEST_METRICS_ENABLED = os.getenv('REQUEST_METRICS_ENABLED', 'False').lower() == 'true'
+# 查询数超过视图声明的预算时抛出异常，用于测试
+REQUEST_METRICS_STRICT = os.getenv('REQUEST_METRICS_STRICT', 'False').lower() == 'true'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'hetaoshu.metrics': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+def request_size_message():
+    return f'一次上传的内容合计不能超过{settings.UPLOAD_MAX_REQUEST_SIZE // 1048576}M'
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """上传文件按块写入临时文件，不在worker内存中缓存整个请求体；
+    写入过程中同时检查单个文件和整个请求的大小，超过限制立即中止"""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # 请求头中声明的大小已超限时直接拒绝，不读取请求体
+        if content_length and content_length > settings.UPLOAD_MAX_REQUEST_SIZE:
+            raise RequestDataTooBig(request_size_message())
+        self.request_received = 0
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file_received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file_received += len(raw_data)
+        self.request_received += len(raw_data)
+        if self.file_received > settings.UPLOAD_MAX_FILE_SIZE:
+            self.abort(f'单个文件不能超过{settings.UPLOAD_MAX_FILE_SIZE // 1048576}M')
+        if self.request_received > settings.UPLOAD_MAX_REQUEST_SIZE:
+            self.abort(request_size_message())
+        return super().receive_data_chunk(raw_data, start)
+
+    def abort(self, message):
+        # 关闭临时文件，已写入的部分随之删除；由hetaoshu.parsers.LimitedMultiPartParser转换为413响应
+        self.file.close()
+        raise RequestDataTooBig(message)
@@ -0,0 +1,138 @@
+import functools
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from hetaoshu.renderers import FastJSONRenderer
+from users.authentication import update_cached_token
+from .models import Post, Theme
+from .serializers import PostSerializer, ThemeSerializer, ThemeReplyTreeSerializer, MessageSerializer
+from .pagination import FeedPagination
+from .conditional import make_etag, not_modified, set_etag
+from .views import PostViewSet, ThemeViewSet, message_window_start, touch_last_login
+from . import cache
+
+# 热点读接口的异步版本，ASGI部署（ASYNC_VIEWS开启）时处理对应URL的GET请求，其他请求方法仍交给原DRF视图。
+# 视图在事件循环中执行，查询使用Django的异步ORM，等待数据库时不占用worker；
+# 序列化在事件循环中进行，访问未预取的关联对象会抛出SynchronousOnlyOperation，查询集需一次取全所需数据。
+
+renderer = FastJSONRenderer()
+
+def render(response):
+    """把DRF的Response直接渲染为HttpResponse，交给Django延迟渲染时会被放到线程中执行"""
+    if not isinstance(response, Response):
+        return response
+    rendered = HttpResponse(renderer.render(response.data), status=response.status_code, content_type=renderer.media_type)
+    for header, value in response.items():
+        if header.lower() != 'content-type':
+            rendered[header] = value
+    patch_vary_headers(rendered, ('Accept',))
+    return rendered
+
+def handle_exception(exc, request, authenticators):
+    """与APIView.handle_exception相同：认证失败时返回401并带上WWW-Authenticate，其他异常转换为DRF格式的错误响应"""
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        auth_header = authenticators[0].authenticate_header(request) if authenticators else None
+        if auth_header:
+            exc.auth_header = auth_header
+        else:
+            exc.status_code = 403
+    response = api_settings.EXCEPTION_HANDLER(exc, {'request': request})
+    if response is None:
+        raise exc
+    return response
+
+def async_api_view(fallback):
+    """异步只读视图的装饰器
+
+    与DRF视图相同，按DEFAULT_AUTHENTICATION_CLASSES认证（在线程中执行）并要求登录；
+    视图接收DRF的Request、返回DRF的Response。fallback为同一URL原来的DRF视图，
+    处理GET以外的请求方法，查询预算也按fallback的视图集声明。
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await sync_to_async(fallback)(request, *args, **kwargs)
+            authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+            drf_request = Request(request, authenticators=authenticators)
+            try:
+                user = await sync_to_async(lambda: drf_request.user)()
+                if not user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+                response = await view(drf_request, *args, **kwargs)
+            except Exception as exc:
+                response = handle_exception(exc, drf_request, authenticators)
+            return render(response)
+        # 与DRF视图一样由认证类自行处理CSRF
+        wrapper.csrf_exempt = True
+        wrapper.cls = fallback.cls
+        wrapper.actions = fallback.actions
+        return wrapper
+    return decorator
+
+async def get_or_404(queryset, **kwargs):
+    """get_object_or_404的异步版本"""
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+@async_api_view(ThemeViewSet.as_view({'get': 'list', 'post': 'create'}))
+async def theme_list(request):
+    """主题信息流，同ThemeViewSet.list"""
+    themes = Theme.objects.filter(is_active=True).for_feed().order_by('-created_at')
+    paginator = FeedPagination()
+    page = await paginator.apaginate_queryset(themes, request)
+    serializer = ThemeSerializer(page, many=True, context={'request': request, 'list': True})
+    return paginator.get_paginated_response(serializer.data)
+
+@async_api_view(ThemeViewSet.as_view({'get': 'get_reply_tree'}))
+async def reply_tree(request, pk):
+    """主题回复树，同ThemeViewSet.get_reply_tree；未命中缓存时在线程中构建"""
+    layout = request.query_params.get('layout', 'nested')
+    if layout not in ThemeViewSet.reply_tree_layouts:
+        raise exceptions.ValidationError({'layout': f'可选值为{", ".join(ThemeViewSet.reply_tree_layouts)}'})
+    theme = await get_or_404(Theme.objects.filter(is_active=True).select_related('author'), pk=pk)
+    etag = make_etag('reply_tree', layout, theme.pk, await sync_to_async(cache.get_theme_version)(theme.pk))
+    response = not_modified(request, etag)
+    if response is None:
+        data = await sync_to_async(cache.get_reply_tree)(
+            theme, lambda: ThemeReplyTreeSerializer(theme, context={'layout': layout}).data, layout
+        )
+        response = Response(data)
+    return set_etag(response, etag)
+
+@async_api_view(PostViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}))
+async def post_detail(request, pk):
+    """帖子详情，同PostViewSet.retrieve"""
+    instance = await get_or_404(Post.objects.filter(is_active=True).for_detail(), pk=pk)
+    etag = make_etag('post', instance.pk, instance.updated_at, await sync_to_async(cache.get_theme_version)(instance.theme_id))
+    response = not_modified(request, etag)
+    if response is None:
+        response = Response(PostSerializer(instance, context={'request': request}).data)
+    return set_etag(response, etag)
+
+@async_api_view(PostViewSet.as_view({'get': 'get_messages'}))
+async def messages(request):
+    """收到的回复，同PostViewSet.get_messages"""
+    user = request.user
+    last_login = message_window_start(user)
+    queryset = Post.objects.received_by(user, last_login)
+    if request.query_params.get('unread_count'):
+        return Response({'unread_count': await queryset.acount()})
+
+    if touch_last_login(user, last_login):
+        await user.asave(update_fields=['last_login'])
+        await sync_to_async(update_cached_token)(request.auth)
+    queryset = queryset.select_related('author', 'theme', 'parent').order_by('-created_at')
+    paginator = FeedPagination()
+    if not any(param in request.query_params for param in (paginator.cursor_query_param, paginator.page_query_param, paginator.page_size_query_param)):
+        page = [message async for message in queryset]
+        return Response(MessageSerializer(page, many=True, context={'request': request, 'list': True}).data)
+    page = await paginator.apaginate_queryset(queryset, request)
+    serializer = MessageSerializer(page, many=True, context={'request': request, 'list': True})
+    return paginator.get_paginated_response(serializer.data)
@@ -0,0 +1,40 @@
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# 每个主题一个版本号，主题下的帖子有任何写入都会换成新的随机版本号；
+# 回复树按 主题ID + 版本号 缓存，版本号变化后旧缓存自然失效，无需逐个删除。
+# 不使用incr：文件缓存的incr是先读后写，并发写入时可能丢失一次递增，使读到旧数据的回复树以新版本号缓存下来。
+# 版本号在事务提交后才更换，提交到更换之间（通常为毫秒级）的读请求仍可能拿到旧的回复树；
+# 若进程恰好在此期间退出，旧的回复树最多保留REPLY_TREE_CACHE_TIMEOUT秒
+
+def _version_key(theme_id):
+    return f'theme:{theme_id}:version'
+
+def _reply_tree_key(theme_id, version, layout):
+    return f'theme:{theme_id}:reply_tree:{layout}:{version}'
+
+def get_theme_version(theme_id):
+    """获取主题当前版本号"""
+    key = _version_key(theme_id)
+    version = cache.get(key)
+    if version is None:
+        # 版本号丢失（被淘汰、被清理或缓存重启）时生成新版本号，
+        # 保证不会再命中丢失前写入的旧缓存
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+def bump_theme_version(theme_id):
+    """主题下的内容发生变化后更换版本号，在事务提交后执行，避免读到未提交的数据"""
+    transaction.on_commit(lambda: cache.set(_version_key(theme_id), uuid.uuid4().hex, None))
+
+def get_reply_tree(theme, build, layout='nested'):
+    """从缓存读取主题回复树，未命中时调用build()构建并写入缓存；不同格式分别缓存"""
+    key = _reply_tree_key(theme.pk, get_theme_version(theme.pk), layout)
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, settings.REPLY_TREE_CACHE_TIMEOUT)
+    return data
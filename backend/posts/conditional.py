@@ -0,0 +1,20 @@
+import hashlib
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+# 只使用ETag作为校验器：帖子和主题的updated_at在新增回复、图片时不会变化，
+# 用它作为Last-Modified会让客户端拿到过期的评论数和图片
+
+def make_etag(*parts):
+    """根据若干版本信息生成ETag"""
+    return hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+def not_modified(request, etag):
+    """客户端持有的版本仍然有效时返回304响应，否则返回None"""
+    return get_conditional_response(request, etag=quote_etag(etag))
+
+def set_etag(response, etag):
+    response['ETag'] = quote_etag(etag)
+    # 允许客户端缓存，但每次使用前都要向服务器验证
+    response['Cache-Control'] = 'private, no-cache'
+    return response
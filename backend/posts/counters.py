@@ -0,0 +1,78 @@
+from django.db import transaction
+from django.db.models import F, Count
+from .models import Post, PostImage, Theme
+
+# 计数字段说明：
+# Theme.post_count  主题下有效帖子的数量
+# Post.reply_count  帖子的有效直接回复数量
+# Post.image_count  帖子的图片数量
+
+def post_created(post):
+    """新帖子创建后，更新主题帖子数和父帖子回复数"""
+    if not post.is_active:
+        return
+    Theme.objects.filter(pk=post.theme_id).update(post_count=F('post_count') + 1)
+    if post.parent_id:
+        Post.objects.filter(pk=post.parent_id).update(reply_count=F('reply_count') + 1)
+
+def post_moved(post, old_parent_id):
+    """帖子的父帖子改变后，把回复数从原父帖子移到新父帖子"""
+    if not post.is_active or post.parent_id == old_parent_id:
+        return
+    if old_parent_id:
+        Post.objects.filter(pk=old_parent_id, reply_count__gt=0).update(reply_count=F('reply_count') - 1)
+    if post.parent_id:
+        Post.objects.filter(pk=post.parent_id).update(reply_count=F('reply_count') + 1)
+
+def post_deleted(post):
+    """帖子被物理删除前调用：删除会级联到所有子回复，需一并扣除主题帖子数"""
+    active_count = 1 if post.is_active else 0
+    # 逐层查找子回复，统计其中的有效帖子
+    frontier = [post.pk]
+    while frontier:
+        children = list(Post.objects.filter(parent_id__in=frontier).values_list('id', 'is_active'))
+        active_count += sum(1 for _, is_active in children if is_active)
+        frontier = [child_id for child_id, _ in children]
+    if active_count:
+        Theme.objects.filter(pk=post.theme_id, post_count__gte=active_count).update(post_count=F('post_count') - active_count)
+    if post.is_active and post.parent_id:
+        Post.objects.filter(pk=post.parent_id, reply_count__gt=0).update(reply_count=F('reply_count') - 1)
+
+def images_added(post_id, count):
+    """帖子新增图片后更新图片数"""
+    if count:
+        Post.objects.filter(pk=post_id).update(image_count=F('image_count') + count)
+
+def images_removed(post_id, count):
+    """帖子删除图片后更新图片数"""
+    if count:
+        Post.objects.filter(pk=post_id, image_count__gte=count).update(image_count=F('image_count') - count)
+
+def _bulk_set(model, field, counts, batch_size=1000):
+    """先将计数清零，再批量写入非零计数"""
+    model.objects.exclude(**{field: 0}).update(**{field: 0})
+    objs = [model(pk=pk, **{field: count}) for pk, count in counts.items()]
+    model.objects.bulk_update(objs, [field], batch_size=batch_size)
+
+def rebuild_counters():
+    """根据现有数据重新计算全部计数，用于回填和修正偏差"""
+    reply_counts = dict(
+        Post.objects.filter(is_active=True, parent__isnull=False)
+        .order_by().values_list('parent').annotate(count=Count('id'))
+    )
+    image_counts = dict(
+        PostImage.objects.order_by().values_list('post').annotate(count=Count('id'))
+    )
+    post_counts = dict(
+        Post.objects.filter(is_active=True)
+        .order_by().values_list('theme').annotate(count=Count('id'))
+    )
+    with transaction.atomic():
+        _bulk_set(Post, 'reply_count', reply_counts)
+        _bulk_set(Post, 'image_count', image_counts)
+        _bulk_set(Theme, 'post_count', post_counts)
+    return {
+        'reply_count': len(reply_counts),
+        'image_count': len(image_counts),
+        'post_count': len(post_counts),
+    }
@@ -0,0 +1,269 @@
+import asyncio
+import json
+import logging
+import secrets
+import time
+from collections import defaultdict, deque
+from datetime import timedelta
+from hashlib import sha256
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import ReplyEvent
+
+# 回复通知推送（Server-Sent Events）：
+# 1. 回复帖子时在同一事务中向ReplyEvent写入一行，事务提交后立即交给本进程的Broker分发；
+# 2. 每个进程的Broker在有连接时运行一个轮询任务，按时间窗口读取其他进程写入的事件，一次查询服务本进程全部连接；
+# 3. 每个连接只是事件循环中的一个协程和一个队列，不占用线程和数据库连接，空闲时只定期发送心跳。
+
+logger = logging.getLogger('hetaoshu.events')
+
+EVENTS_PATH = '/api/events/'
+# 每个连接最多缓存的未发送事件数，客户端消费过慢时丢弃，重连时按Last-Event-ID补发
+QUEUE_SIZE = 100
+# 断线重连时最多补发的事件数
+BACKLOG_SIZE = 100
+# 去重用的最近事件ID数，需大于一个轮询窗口内的事件数
+RECENT_SIZE = 10000
+POLL_BATCH_SIZE = 500
+
+def reply_created(post, payload):
+    """回复创建后在同一事务中调用：给父帖子作者写入通知，回复自己的帖子不通知"""
+    parent = post.parent
+    if parent is None or not post.is_active or parent.author_id == post.author_id:
+        return None
+    event = ReplyEvent.objects.create(recipient_id=parent.author_id, post=post, payload=payload)
+    data = {'id': event.id, 'recipient': event.recipient_id, 'payload': payload}
+    transaction.on_commit(lambda: broker.publish(data))
+    return event
+
+def db_call(func):
+    """在线程池中执行数据库操作，前后按CONN_MAX_AGE或连接池设置回收连接"""
+    def run(*args):
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+# EventSource无法设置请求头，连接时通过查询参数传递的是一次性的连接凭证而不是登录令牌，
+# 访问日志中出现的凭证已经用过或很快过期
+
+def _ticket_key(ticket):
+    return 'events:ticket:' + sha256(ticket.encode()).hexdigest()
+
+def issue_ticket(user_id):
+    """为已登录用户生成连接凭证，EVENTS_TICKET_TIMEOUT秒内有效，只能使用一次"""
+    ticket = secrets.token_urlsafe(32)
+    cache.set(_ticket_key(ticket), user_id, settings.EVENTS_TICKET_TIMEOUT)
+    return ticket
+
+@db_call
+def authenticate(ticket):
+    """使用连接凭证，返回用户ID；凭证无效、过期或已使用时返回None"""
+    if not ticket:
+        return None
+    key = _ticket_key(ticket)
+    user_id = cache.get(key)
+    # 同一凭证并发使用时只有一个请求能删除成功
+    if user_id is None or not cache.delete(key):
+        return None
+    return user_id
+
+@db_call
+def fetch_events(since, after):
+    return list(
+        ReplyEvent.objects.filter(created_at__gte=since, id__gt=after)
+        .order_by('id').values('id', 'recipient', 'payload')[:POLL_BATCH_SIZE]
+    )
+
+@db_call
+def fetch_backlog(user_id, last_event_id):
+    """断线期间的事件，按ID升序"""
+    return list(
+        ReplyEvent.objects.filter(recipient_id=user_id, id__gt=last_event_id)
+        .order_by('id').values('id', 'recipient', 'payload')[:BACKLOG_SIZE]
+    )
+
+@db_call
+def prune_events():
+    """删除超过保留时间的事件"""
+    cutoff = timezone.now() - timedelta(seconds=settings.EVENTS_RETENTION)
+    return ReplyEvent.objects.filter(created_at__lt=cutoff).delete()[0]
+
+class Broker:
+    """进程内的事件分发：按接收者保存各连接的队列
+
+    除publish外的方法都在事件循环中调用。事件可能同时来自本进程的publish和轮询，按ID去重。
+    """
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.loop = None
+        self.poller = None
+        self.recent = deque()
+        self.recent_ids = set()
+
+    def subscribe(self, user_id):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            # 首次使用，或事件循环已更换（如测试中），旧循环上的连接和轮询任务都已失效
+            self.loop, self.poller = loop, None
+            self.subscribers.clear()
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.subscribers[user_id].add(queue)
+        if self.poller is None:
+            self.poller = loop.create_task(self.poll())
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+
+    def publish(self, event):
+        """可在任意线程调用：本进程写入的事件不必等待下次轮询"""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self.dispatch, event)
+        except RuntimeError:  # 事件循环已关闭
+            pass
+
+    def dispatch(self, event):
+        if event['id'] in self.recent_ids:
+            return
+        self.recent.append(event['id'])
+        self.recent_ids.add(event['id'])
+        if len(self.recent) > RECENT_SIZE:
+            self.recent_ids.discard(self.recent.popleft())
+        for queue in self.subscribers.get(event['recipient'], ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass
+
+    async def poll(self):
+        """有连接时每隔EVENTS_POLL_INTERVAL秒读取一次新事件，没有连接时退出
+
+        自增ID的分配顺序和事务提交顺序不一定相同，按created_at时间窗口读取而不是只读大于上次ID的事件，
+        窗口向前多取EVENTS_POLL_LOOKBACK秒，覆盖写入后较晚提交的事务。
+        """
+        since = timezone.now() - timedelta(seconds=settings.EVENTS_POLL_LOOKBACK)
+        next_prune = time.monotonic()
+        try:
+            while self.subscribers:
+                await asyncio.sleep(settings.EVENTS_POLL_INTERVAL)
+                started = timezone.now()
+                try:
+                    after = 0
+                    while True:
+                        events = await fetch_events(since, after)
+                        for event in events:
+                            self.dispatch(event)
+                        if len(events) < POLL_BATCH_SIZE:
+                            break
+                        after = events[-1]['id']
+                    since = started - timedelta(seconds=settings.EVENTS_POLL_LOOKBACK)
+                    if time.monotonic() >= next_prune:
+                        next_prune = time.monotonic() + settings.EVENTS_PRUNE_INTERVAL
+                        await prune_events()
+                except Exception:
+                    logger.exception('读取回复通知失败')
+        finally:
+            if self.poller is asyncio.current_task():
+                self.poller = None
+
+broker = Broker()
+
+def format_event(event):
+    data = json.dumps(event['payload'], cls=DjangoJSONEncoder, ensure_ascii=False)
+    return f'id: {event["id"]}\nevent: reply\ndata: {data}\n\n'.encode('utf-8')
+
+def allowed_origin(origin):
+    """EventSource跨域请求时按CORS_ALLOWED_ORIGINS返回Access-Control-Allow-Origin"""
+    if origin and (getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False) or origin in settings.CORS_ALLOWED_ORIGINS):
+        return origin
+    return None
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+async def sse_application(scope, receive, send):
+    """回复通知的SSE接口，ASGI应用，不经过Django的中间件和视图
+
+    GET /api/events/?ticket=<凭证>  凭证由POST /api/events/ticket/获取，只能使用一次；
+    浏览器自动重连会因凭证已使用而失败，客户端需重新获取凭证后再连接。
+    每条事件的data与/api/messages/列表中的一项相同；断线重连时浏览器自动带上Last-Event-ID，
+    服务端补发之后的事件，也可以用last_event_id查询参数指定。
+    """
+    headers = {name.decode('latin1').lower(): value.decode('latin1') for name, value in scope['headers']}
+    query = parse_qs(scope.get('query_string', b'').decode('latin1'))
+    response_headers = [(b'vary', b'Origin')]
+    origin = allowed_origin(headers.get('origin'))
+    if origin:
+        response_headers.append((b'access-control-allow-origin', origin.encode('latin1')))
+
+    async def send_error(status, detail):
+        body = json.dumps({'detail': detail}, ensure_ascii=False).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [*response_headers, (b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    if scope['method'] != 'GET':
+        await send_error(405, '只支持GET请求')
+        return
+    user_id = await authenticate(query.get('ticket', [None])[0])
+    if user_id is None:
+        await send_error(401, '身份认证信息未提供或无效')
+        return
+    last_event_id = headers.get('last-event-id') or query.get('last_event_id', [None])[0]
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        *response_headers,
+        (b'content-type', b'text/event-stream; charset=utf-8'),
+        (b'cache-control', b'no-cache'),
+        # 关闭nginx的代理缓冲，事件立即送达
+        (b'x-accel-buffering', b'no'),
+    ]})
+    queue = broker.subscribe(user_id)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.body', 'body': f'retry: {settings.EVENTS_RETRY}\n\n'.encode(), 'more_body': True})
+        sent = set()
+        if last_event_id is not None:
+            for event in await fetch_backlog(user_id, last_event_id):
+                sent.add(event['id'])
+                await send({'type': 'http.response.body', 'body': format_event(event), 'more_body': True})
+        while not disconnected.done():
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter, disconnected}, timeout=settings.EVENTS_HEARTBEAT,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+                if not disconnected.done():
+                    # 心跳注释，保持连接并及时发现断开的客户端
+                    await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+                continue
+            event = getter.result()
+            if event['id'] in sent or (last_event_id is not None and event['id'] <= last_event_id):
+                continue
+            await send({'type': 'http.response.body', 'body': format_event(event), 'more_body': True})
+    finally:
+        disconnected.cancel()
+        broker.unsubscribe(user_id, queue)
@@ -0,0 +1,119 @@
+import io
+import posixpath
+import traceback
+from datetime import timedelta
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.base import ContentFile
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps
+from .models import ImageJob
+from . import cache
+
+# 图片变体及其最大尺寸：thumb为卡片使用的缩略图，feed为信息流宽度的图片；
+# 按原图比例缩放到最大尺寸以内，不放大
+VARIANTS = {
+    'thumb': (480, 480),
+    'feed': (1080, 1080 * 4),
+}
+QUALITY = 80
+VARIANT_DIR = 'post_images/variants'
+
+def supported_formats():
+    """当前Pillow可以编码的现代图片格式，AVIF需要Pillow自带或安装插件支持"""
+    Image.init()
+    return [fmt for fmt in ('webp', 'avif') if fmt.upper() in Image.SAVE]
+
+def variant_path(post_image, name, fmt):
+    """变体文件路径只由图片ID、变体名和格式决定，重复生成会覆盖同一文件"""
+    return posixpath.join(VARIANT_DIR, str(post_image.pk), f'{name}.{fmt}')
+
+def _resize(image, size):
+    resized = image.copy()
+    resized.thumbnail(size, Image.Resampling.LANCZOS)
+    return resized
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    # 不传exif参数，输出文件不包含原图的EXIF信息
+    image.save(buffer, format=fmt.upper(), quality=QUALITY)
+    return buffer.getvalue()
+
+def generate_variants(post_image):
+    """为PostImage生成各尺寸、各格式的变体，并记录路径和尺寸，可重复执行"""
+    storage = post_image.image.storage
+    with post_image.image.open('rb') as f:
+        with Image.open(f) as original:
+            # 按EXIF方向旋转手机照片
+            image = ImageOps.exif_transpose(original)
+            image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    variants = {}
+    for name, size in VARIANTS.items():
+        resized = _resize(image, size)
+        variants[name] = {}
+        for fmt in supported_formats():
+            path = variant_path(post_image, name, fmt)
+            if storage.exists(path):
+                storage.delete(path)
+            storage.save(path, ContentFile(_encode(resized, fmt)))
+            variants[name][fmt] = {'path': path, 'width': resized.width, 'height': resized.height}
+
+    post_image.width = image.width
+    post_image.height = image.height
+    post_image.variants = variants
+    post_image.save(update_fields=['width', 'height', 'variants'])
+    return variants
+
+# 上传请求只登记任务，由 manage.py run_image_worker 在独立进程中生成变体；
+# 变体生成完成前variants为空，客户端使用原图
+
+def enqueue_variants(post_image):
+    """登记图片的变体生成任务，已有任务时重置为等待处理"""
+    ImageJob.objects.update_or_create(image=post_image, defaults={'status': 'pending', 'attempts': 0, 'error': ''})
+
+def claim_jobs(limit):
+    """领取最多limit个等待中的任务，通过带状态条件的UPDATE保证多个worker不会领取同一任务"""
+    job_ids = list(
+        ImageJob.objects.filter(status='pending').order_by('created_at').values_list('id', flat=True)[:limit]
+    )
+    claimed = []
+    for job_id in job_ids:
+        if ImageJob.objects.filter(pk=job_id, status='pending').update(
+            status='running', attempts=F('attempts') + 1, updated_at=timezone.now()
+        ):
+            claimed.append(job_id)
+    return claimed
+
+def requeue_stale_jobs(seconds):
+    """worker异常退出时遗留的处理中任务，超时后重新放回队列"""
+    return ImageJob.objects.filter(
+        status='running', updated_at__lt=timezone.now() - timedelta(seconds=seconds)
+    ).update(status='pending')
+
+def run_job(job_id, max_attempts):
+    """执行一个已领取的任务，失败次数未达上限时放回队列；任务在执行期间被删除时返回None"""
+    try:
+        job = ImageJob.objects.select_related('image__post').get(pk=job_id)
+    except ImageJob.DoesNotExist:
+        # 图片已被删除，任务随之删除
+        return None
+    try:
+        generate_variants(job.image)
+    except Exception:
+        job.status = 'pending' if job.attempts < max_attempts else 'failed'
+        job.error = traceback.format_exc()
+    else:
+        job.status = 'done'
+        job.error = ''
+        # 回复树缓存和ETag中包含图片信息，需要随之失效
+        cache.bump_theme_version(job.image.post.theme_id)
+    try:
+        # 图片（及随之级联删除的任务）在处理期间被删除时，update_fields保存找不到行会抛出DatabaseError
+        job.save(update_fields=['status', 'error', 'updated_at'])
+    except (DatabaseError, ObjectDoesNotExist):
+        return None
+    return job.status
@@ -0,0 +1,74 @@
+import gzip
+import random
+import statistics
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from hetaoshu.renderers import FastJSONRenderer, orjson
+from hetaoshu.middleware import brotli
+from posts.serializers import ThemeReplyTreeSerializer
+from users.models import User
+from .benchmark_reply_tree import create_thread
+
+FILLER = '今天在图书馆三楼找到一本很久以前的教材，封面有点旧但内容完整，有需要的同学可以留言联系我。'
+
+class Command(BaseCommand):
+    help = '测量回复树JSON的构建、渲染耗时和压缩后的传输字节数，对比嵌套和扁平格式、标准库和orjson渲染器（数据在事务中回滚，不会保留）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=5000, help='回复树的节点数')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--authors', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            authors = User.objects.bulk_create([
+                User(student_id=f'bench{i}', email=f'bench{i}@bench.local', name=f'用户{i}')
+                for i in range(options['authors'])
+            ])
+            theme = create_thread(options['size'] - 1, authors, rng, text=lambda i: FILLER[:rng.randint(10, len(FILLER))])
+            layouts = {}
+            for layout in ('nested', 'flat'):
+                start = time.perf_counter()
+                layouts[layout] = ThemeReplyTreeSerializer(theme, context={'layout': layout}).data
+                self.stdout.write(f'build   {layout:<12} {(time.perf_counter() - start) * 1000:7.2f}ms')
+            transaction.set_rollback(True)
+
+        renderers = [('stdlib json', JSONRenderer())]
+        if orjson is not None:
+            renderers.append(('orjson', FastJSONRenderer()))
+        else:
+            self.stdout.write('未安装orjson，FastJSONRenderer与标准库实现相同')
+        for layout, data in layouts.items():
+            self.stdout.write(f'-- layout={layout}')
+            for label, renderer in renderers:
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    content = renderer.render(data, 'application/json')
+                    timings.append(time.perf_counter() - start)
+                self.stdout.write(f'render  {label:<12} median={statistics.median(timings) * 1000:7.2f}ms  bytes={len(content)}')
+
+            self.report('identity', content, lambda body: body, options['repeat'])
+            self.report(f'gzip-{settings.COMPRESSION_GZIP_LEVEL}', content,
+                        lambda body: gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0), options['repeat'])
+            if brotli is not None:
+                self.report(f'br-{settings.COMPRESSION_BROTLI_QUALITY}', content,
+                            lambda body: brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY), options['repeat'])
+            else:
+                self.stdout.write('未安装brotli，跳过br')
+
+    def report(self, label, content, compress, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = compress(content)
+            timings.append(time.perf_counter() - start)
+        self.stdout.write(
+            f'wire    {label:<12} median={statistics.median(timings) * 1000:7.2f}ms  bytes={len(body)}  '
+            f'ratio={len(body) / len(content):.3f}'
+        )
@@ -0,0 +1,57 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from posts.models import Post, Theme
+from posts.serializers import build_reply_tree
+from users.models import User
+
+def create_thread(size, authors, rng, text=None):
+    """创建一个主题：根帖子加size条回复，父节点在已有帖子中随机选取，并混入一条长链
+
+    text(i)返回第i条回复的内容，默认为简短的英文
+    """
+    author = authors[0]
+    theme = Theme.objects.create(title=f'bench-{size}', author=author)
+    root = Post.objects.create(content='root', author=author, theme=theme)
+    theme.first_post = root
+    theme.save(update_fields=['first_post'])
+    posts = [root]
+    for i in range(size):
+        # 一半回复接在最新帖子下形成深链，另一半随机分叉
+        parent = posts[-1] if i % 2 else rng.choice(posts)
+        posts.append(Post(content=text(i) if text else f'reply {i}', author=rng.choice(authors), theme=theme, parent=parent))
+    Post.objects.bulk_create(posts[1:], batch_size=1000)
+    return theme
+
+class Command(BaseCommand):
+    help = '在临时数据上测量不同规模回复树的构建耗时和查询次数（数据在事务中回滚，不会保留）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000], help='每个测试主题的回复数')
+        parser.add_argument('--repeat', type=int, default=5, help='每个规模重复测量的次数')
+        parser.add_argument('--authors', type=int, default=50, help='参与回复的用户数')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            authors = User.objects.bulk_create([
+                User(student_id=f'bench{i}', email=f'bench{i}@bench.local', name=f'bench{i}')
+                for i in range(options['authors'])
+            ])
+            for size in options['sizes']:
+                theme = create_thread(size, authors, rng)
+                timings = []
+                for _ in range(options['repeat']):
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        build_reply_tree(theme)
+                        timings.append(time.perf_counter() - start)
+                self.stdout.write(
+                    f'replies={size:>6}  median={statistics.median(timings) * 1000:8.1f}ms  '
+                    f'max={max(timings) * 1000:8.1f}ms  queries={len(queries)}'
+                )
+            transaction.set_rollback(True)
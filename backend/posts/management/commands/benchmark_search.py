@@ -0,0 +1,104 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from posts.models import Post, SearchToken, Theme
+from posts.search import post_tokens, search
+from users.models import User
+
+# 语料用字和目标短语用字互不重叠，目标短语只会出现在预先埋入的帖子中，
+# 据此计算排序结果的召回率和MRR
+CORPUS_CHARS = '的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处理府研质'
+NEEDLE_CHARS = '鲲鹏鸾凤麒麟蛟螭貔貅饕餮梼杌獬豸狻猊睚眦'
+
+class Command(BaseCommand):
+    help = '在生成的语料上测量搜索的相关度（召回率、MRR）和延迟（数据在事务中回滚，不会保留）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000000, help='生成的帖子数')
+        parser.add_argument('--queries', type=int, default=20, help='相关度测试的查询数')
+        parser.add_argument('--relevant', type=int, default=10, help='每个测试查询埋入的相关帖子数')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            author = User.objects.create(student_id='benchsearch', email='benchsearch@bench.local', name='benchsearch')
+            theme = Theme.objects.create(title='bench-search', author=author)
+            root = Post.objects.create(content='root', author=author, theme=theme)
+            needles = self.make_needles(rng, options)
+            start = time.perf_counter()
+            relevant = self.create_corpus(rng, options, author, theme, root, needles)
+            self.stdout.write(f'生成并索引{options["posts"]}个帖子耗时{time.perf_counter() - start:.1f}s，'
+                              f'索引{SearchToken.objects.count()}行')
+
+            recalls, reciprocal_ranks, timings = [], [], []
+            for needle in needles:
+                elapsed, ids, queries = self.run_query(needle)
+                timings.append(elapsed)
+                top = ids[:options['relevant']]
+                recalls.append(len(relevant[needle] & set(top)) / len(relevant[needle]))
+                rank = next((i + 1 for i, pk in enumerate(ids) if pk in relevant[needle]), None)
+                reciprocal_ranks.append(1 / rank if rank else 0)
+            self.stdout.write(f'相关度：recall@{options["relevant"]}={statistics.mean(recalls):.3f}  '
+                              f'MRR={statistics.mean(reciprocal_ranks):.3f}')
+            self.report('目标短语查询', timings, queries)
+
+            # 高频词查询命中大量帖子，是排序聚合的最坏情况
+            common = [''.join(rng.choice(CORPUS_CHARS) for _ in range(rng.choice([2, 3, 4]))) for _ in range(options['queries'])]
+            timings = []
+            for query in common:
+                elapsed, _, queries = self.run_query(query)
+                timings.append(elapsed)
+            self.report('常用词查询', timings, queries)
+            transaction.set_rollback(True)
+
+    def make_needles(self, rng, options):
+        needles = set()
+        while len(needles) < options['queries']:
+            needles.add(''.join(rng.sample(NEEDLE_CHARS, 3)))
+        return sorted(needles)
+
+    def create_corpus(self, rng, options, author, theme, root, needles):
+        """批量生成帖子并直接写入索引，每个目标短语随机埋入relevant个帖子"""
+        total = options['posts']
+        planted = {}
+        for needle in needles:
+            for index in rng.sample(range(total), options['relevant']):
+                planted.setdefault(index, []).append(needle)
+        relevant = {needle: set() for needle in needles}
+        for offset in range(0, total, options['batch_size']):
+            posts = []
+            for index in range(offset, min(offset + options['batch_size'], total)):
+                words = [''.join(rng.choice(CORPUS_CHARS) for _ in range(rng.randint(2, 6))) for _ in range(rng.randint(5, 15))]
+                for needle in planted.get(index, []):
+                    words.insert(rng.randrange(len(words) + 1), needle)
+                posts.append(Post(content='，'.join(words), author=author, theme=theme, parent=root))
+            Post.objects.bulk_create(posts)
+            tokens = []
+            for post in posts:
+                tokens.extend(SearchToken(token=token, post=post, weight=weight) for token, weight in post_tokens(post).items())
+            SearchToken.objects.bulk_create(tokens, batch_size=options['batch_size'])
+            for post in posts:
+                for needle in needles:
+                    if needle in post.content:
+                        relevant[needle].add(post.pk)
+        return relevant
+
+    def run_query(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            ids = [row['post'] for row in search(query)[:25]]
+            elapsed = time.perf_counter() - start
+        return elapsed, ids, len(queries)
+
+    def report(self, label, timings, queries):
+        timings = sorted(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f'{label}：median={statistics.median(timings) * 1000:8.1f}ms  '
+            f'p95={p95 * 1000:8.1f}ms  max={timings[-1] * 1000:8.1f}ms  queries={queries}'
+        )
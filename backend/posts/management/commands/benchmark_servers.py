@@ -0,0 +1,185 @@
+import json
+import os
+import shlex
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+from users.models import User
+from .run_benchmark import SCENARIOS
+from .seed_benchmark_data import STUDENT_ID_PREFIX
+
+SERVERS = {
+    'wsgi': 'gunicorn hetaoshu.wsgi:application --bind 127.0.0.1:{port} --workers {workers} --timeout 60',
+    'asgi': 'uvicorn hetaoshu.asgi:application --host 127.0.0.1 --port {port} --workers {workers}',
+}
+
+def process_tree_rss(pid):
+    """进程及其全部子进程的常驻内存之和（MB），依赖Linux的/proc，无法读取时返回None"""
+    try:
+        parents = {}
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    with open(f'/proc/{entry}/stat') as f:
+                        # 进程名可能含空格，ppid在最后一个右括号之后的第二个字段
+                        parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+    except OSError:
+        return None
+    tree, frontier = {pid}, [pid]
+    while frontier:
+        children = [child for child, parent in parents.items() if parent in frontier]
+        tree.update(children)
+        frontier = children
+    total = 0
+    for member in tree:
+        try:
+            with open(f'/proc/{member}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return round(total / 1024, 1)
+
+def wait_ready(server, base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise CommandError(f'服务启动失败，退出码{server.returncode}')
+        try:
+            urllib.request.urlopen(f'{base_url}/api/users/public-key/', timeout=2).read()
+            return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+    raise CommandError('等待服务启动超时')
+
+@contextmanager
+def running_server(command, base_url):
+    """启动服务并等待就绪，返回服务进程"""
+    env = {**os.environ, 'REQUEST_METRICS_ENABLED': 'True', 'DEBUG': 'False'}
+    env.setdefault('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE)
+    # 在独立的进程组中启动，结束时连同worker进程一起终止
+    server = subprocess.Popen(shlex.split(command), cwd=settings.BASE_DIR, env=env, start_new_session=True,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(server, base_url)
+        yield server
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            os.killpg(server.pid, signal.SIGKILL)
+            server.wait()
+
+class SlowUploaders:
+    """模拟慢速上传的客户端：发送请求头后每隔interval秒发送1个字节的请求体
+
+    同步worker在读取请求体时被占用，直到上传结束；ASGI服务器在事件循环中接收请求体，不占用worker。
+    """
+
+    def __init__(self, base_url, count, token, interval=0.5):
+        parts = urlsplit(base_url)
+        self.address = (parts.hostname, parts.port or 80)
+        self.count, self.token, self.interval = count, token, interval
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for _ in range(self.count):
+            thread = threading.Thread(target=self.upload, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+
+    def upload(self):
+        while not self.stop_event.is_set():
+            try:
+                with socket.create_connection(self.address, timeout=10) as sock:
+                    sock.sendall((
+                        f'POST /api/posts/ HTTP/1.1\r\nHost: {self.address[0]}\r\n'
+                        f'Authorization: Token {self.token}\r\nContent-Type: application/json\r\n'
+                        f'Content-Length: 1000000\r\n\r\n'
+                    ).encode('ascii'))
+                    while not self.stop_event.wait(self.interval):
+                        sock.sendall(b' ')
+            except OSError:
+                # 服务端超时断开后重新连接
+                self.stop_event.wait(self.interval)
+
+class Command(BaseCommand):
+    help = ('分别启动WSGI（gunicorn同步worker）和ASGI（uvicorn）服务，在相同的请求负载和慢速上传干扰下'
+            '比较各并发数的延迟、吞吐量和服务进程的内存占用，结果以JSON输出。需要先执行seed_benchmark_data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', choices=SERVERS, default=list(SERVERS))
+        parser.add_argument('--wsgi-workers', type=int, default=4)
+        parser.add_argument('--asgi-workers', type=int, default=2,
+                            help='ASGI进程数，按WSGI服务的内存占用调整，使两者在相近的内存下比较')
+        parser.add_argument('--port', type=int, default=8010)
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[4, 16, 64])
+        parser.add_argument('--requests', type=int, default=200, help='每个场景、每个并发数的请求数')
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=['feed', 'reply_tree', 'messages'])
+        parser.add_argument('--slow-clients', type=int, default=2,
+                            help='测试期间保持的慢速上传连接数，不少于WSGI进程数时同步worker会被全部占用')
+        parser.add_argument('--output', help='结果写入的JSON文件，默认输出到标准输出')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(student_id__startswith=STUDENT_ID_PREFIX, is_active=True).first()
+        if user is None:
+            raise CommandError('没有找到生成的用户，请先执行 manage.py seed_benchmark_data')
+        token = Token.objects.get_or_create(user=user)[0].key
+        report = {'slow_clients': options['slow_clients'], 'requests_per_scenario': options['requests'], 'servers': {}}
+        for name in options['servers']:
+            command = SERVERS[name].format(port=options['port'], workers=options[f'{name}_workers'])
+            report['servers'][name] = self.benchmark(command, token, options)
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def benchmark(self, command, token, options):
+        base_url = f'http://127.0.0.1:{options["port"]}'
+        self.stderr.write(f'启动 {command}')
+        with running_server(command, base_url) as server:
+            result = {'command': command, 'idle_rss_mb': process_tree_rss(server.pid), 'runs': {}}
+            slow = SlowUploaders(base_url, options['slow_clients'], token)
+            slow.start()
+            try:
+                for concurrency in options['concurrency']:
+                    result['runs'][concurrency] = self.run_load(base_url, concurrency, options)
+                    result['runs'][concurrency]['rss_mb'] = process_tree_rss(server.pid)
+            finally:
+                slow.stop()
+            return result
+
+    def run_load(self, base_url, concurrency, options):
+        with tempfile.NamedTemporaryFile(suffix='.json') as f:
+            call_command('run_benchmark', base_url=base_url, concurrency=concurrency, requests=options['requests'],
+                         scenarios=options['scenarios'], output=f.name, stderr=self.stderr)
+            with open(f.name, encoding='utf-8') as result:
+                scenarios = json.load(result)['scenarios']
+        for scenario, stats in scenarios.items():
+            self.stderr.write(f'  c={concurrency} {scenario}: p50={stats["latency_ms"]["p50"]}ms '
+                              f'p99={stats["latency_ms"]["p99"]}ms throughput={stats["throughput_rps"]}/s errors={stats["errors"]}')
+        return {'scenarios': scenarios}
@@ -0,0 +1,178 @@
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from posts.models import PostImage, Theme
+from users.models import User
+from .benchmark_servers import SERVERS, process_tree_rss, running_server
+from .seed_benchmark_data import STUDENT_ID_PREFIX
+
+UPLOAD_SERVERS = {
+    'runserver': f'{sys.executable} manage.py runserver 127.0.0.1:{{port}} --noreload',
+    **SERVERS,
+}
+CHUNK_SIZE = 1024 * 1024
+
+def noise_png(path, size):
+    """生成约size字节的PNG图片，随机像素几乎无法压缩，文件大小接近像素数据的大小"""
+    side = int((size / 3) ** 0.5)
+    Image.frombytes('RGB', (side, side), os.urandom(side * side * 3)).save(path, format='PNG', compress_level=0)
+
+def multipart_body(fields, files, boundary):
+    """multipart请求体的总长度和逐块生成内容的迭代器，文件内容从磁盘分块读取，不在客户端内存中拼接"""
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, path in files:
+        header = (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                  f'filename="{os.path.basename(path)}"\r\nContent-Type: image/png\r\n\r\n').encode()
+        parts.append((header, path))
+    closing = f'--{boundary}--\r\n'.encode()
+    length = len(closing) + sum(
+        len(part) if isinstance(part, bytes) else len(part[0]) + os.path.getsize(part[1]) + 2 for part in parts
+    )
+
+    def chunks():
+        for part in parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            header, path = part
+            yield header
+            with open(path, 'rb') as f:
+                while chunk := f.read(CHUNK_SIZE):
+                    yield chunk
+            yield b'\r\n'
+        yield closing
+    return length, chunks()
+
+class RssSampler:
+    """后台线程定期采样服务进程及其子进程的常驻内存，记录峰值"""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid, self.interval = pid, interval
+        self.peak = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+
+    def sample(self):
+        while not self.stop_event.is_set():
+            rss = process_tree_rss(self.pid)
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+            self.stop_event.wait(self.interval)
+
+class Command(BaseCommand):
+    help = ('启动服务后并发发送带多张大图片的发帖请求（multipart），统计延迟和服务进程的常驻内存峰值，结果以JSON输出。'
+            '单个文件不能超过UPLOAD_MAX_FILE_SIZE，因此每个请求上传多个文件。需要先执行seed_benchmark_data，'
+            '测试创建的主题和图片在结束后删除')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', choices=UPLOAD_SERVERS, default=['runserver', 'wsgi'])
+        parser.add_argument('--wsgi-workers', type=int, default=4)
+        parser.add_argument('--asgi-workers', type=int, default=2)
+        parser.add_argument('--port', type=int, default=8010)
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+        parser.add_argument('--requests', type=int, default=8, help='每个并发数的请求数')
+        parser.add_argument('--files', type=int, default=3, help='每个请求上传的文件数')
+        parser.add_argument('--file-size', type=int, default=17 * 1024 * 1024, help='每个文件的大小（字节）')
+        parser.add_argument('--output', help='结果写入的JSON文件，默认输出到标准输出')
+
+    def handle(self, *args, **options):
+        if options['file_size'] > settings.UPLOAD_MAX_FILE_SIZE:
+            raise CommandError(f'--file-size不能超过UPLOAD_MAX_FILE_SIZE（{settings.UPLOAD_MAX_FILE_SIZE}字节）')
+        user = User.objects.filter(student_id__startswith=STUDENT_ID_PREFIX, is_active=True).first()
+        if user is None:
+            raise CommandError('没有找到生成的用户，请先执行 manage.py seed_benchmark_data')
+        token = Token.objects.get_or_create(user=user)[0].key
+
+        with tempfile.TemporaryDirectory(prefix='benchmark-uploads-') as directory:
+            self.stderr.write(f'生成{options["files"]}张约{options["file_size"] // 1048576}M的图片')
+            paths = []
+            for i in range(options['files']):
+                paths.append(os.path.join(directory, f'upload-{i}.png'))
+                noise_png(paths[-1], options['file_size'])
+            request_mb = round(sum(os.path.getsize(path) for path in paths) / 1048576, 1)
+            report = {'files_per_request': len(paths), 'request_mb': request_mb,
+                      'requests_per_run': options['requests'], 'servers': {}}
+            for name in options['servers']:
+                command = UPLOAD_SERVERS[name].format(port=options['port'], workers=options.get(f'{name}_workers'))
+                report['servers'][name] = self.benchmark(command, token, paths, options)
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def benchmark(self, command, token, paths, options):
+        self.stderr.write(f'启动 {command}')
+        with running_server(command, f'http://127.0.0.1:{options["port"]}') as server:
+            result = {'command': command, 'idle_rss_mb': process_tree_rss(server.pid), 'runs': {}}
+            for concurrency in options['concurrency']:
+                started = time.monotonic()
+                with RssSampler(server.pid) as sampler, ThreadPoolExecutor(concurrency) as executor:
+                    uploads = list(executor.map(
+                        lambda _: self.upload(options['port'], token, paths), range(options['requests'])
+                    ))
+                elapsed = time.monotonic() - started
+                latencies = sorted(latency for _, latency, _ in uploads)
+                errors = [status for status, _, _ in uploads if status != 201]
+                result['runs'][concurrency] = {
+                    'peak_rss_mb': sampler.peak,
+                    'latency_ms': {'p50': latencies[len(latencies) // 2], 'max': latencies[-1]},
+                    'throughput_mb_s': round(len(uploads) * sum(map(os.path.getsize, paths)) / 1048576 / elapsed, 1),
+                    'errors': len(errors),
+                }
+                self.stderr.write(f'  c={concurrency} peak_rss={sampler.peak}MB p50={latencies[len(latencies) // 2]}ms '
+                                  f'errors={len(errors)} {sorted(set(errors))}')
+                self.cleanup([theme_id for _, _, theme_id in uploads if theme_id])
+            return result
+
+    def upload(self, port, token, paths):
+        """发送一个发帖请求，返回(状态码, 延迟毫秒, 主题ID)"""
+        boundary = uuid.uuid4().hex
+        fields = {'title': '上传基准测试', 'theme_type': 'share', 'content': '上传基准测试', 'description': ''}
+        length, body = multipart_body(fields, [('images[]', path) for path in paths], boundary)
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+        started = time.monotonic()
+        try:
+            connection.request('POST', '/api/themes/', body=body, headers={
+                'Authorization': f'Token {token}',
+                'Content-Type': f'multipart/form-data; boundary={boundary}',
+                'Content-Length': str(length),
+            })
+            response = connection.getresponse()
+            content = response.read()
+            status = response.status
+        except OSError:
+            content, status = b'', 0
+        finally:
+            connection.close()
+        latency = round((time.monotonic() - started) * 1000, 1)
+        theme_id = json.loads(content).get('id') if status == 201 else None
+        return status, latency, theme_id
+
+    def cleanup(self, theme_ids):
+        """删除测试创建的主题及其图片文件，避免占用磁盘"""
+        for image in PostImage.objects.filter(post__theme_id__in=theme_ids):
+            image.image.delete(save=False)
+        Theme.objects.filter(pk__in=theme_ids).delete()
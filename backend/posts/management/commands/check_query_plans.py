@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from posts.query_plans import MIN_ROWS, hot_queries, plan_problems
+from .seed_benchmark_data import STUDENT_ID_PREFIX
+
+class Command(BaseCommand):
+    help = ('对信息流、回复树、帖子子树、图片和验证码等热点查询执行EXPLAIN，在MySQL上出现全表扫描或额外排序（filesort）时以非零状态退出。'
+            '需要先执行seed_benchmark_data。同样的检查在MySQL上运行测试时由posts.tests.QueryPlanTests执行，'
+            '本命令用于在更大的数据量上复查。SQLite的结果仅供参考')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-rows', type=int, default=MIN_ROWS,
+                            help='MySQL对小表可能直接全表扫描，预计扫描行数少于此值的表不算作全表扫描')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('mysql', 'sqlite'):
+            raise CommandError(f'不支持的数据库：{connection.vendor}')
+        checks = hot_queries({'user__student_id__startswith': STUDENT_ID_PREFIX})
+        if checks is None:
+            raise CommandError('没有找到生成的数据，请先执行 manage.py seed_benchmark_data')
+
+        enforce = connection.vendor == 'mysql'
+        if not enforce:
+            self.stdout.write(self.style.WARNING('SQLite的执行计划仅供参考，以本地MySQL上的结果为准'))
+        failures = 0
+        for name, queryset, allow_filesort in checks:
+            problems = plan_problems(queryset, allow_filesort, options['min_rows'])
+            if problems:
+                failures += 1
+                style = self.style.ERROR if enforce else self.style.WARNING
+                self.stdout.write(style(f'{name}: {"；".join(problems)}'))
+                self.stdout.write(f'  {queryset.query}')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: OK'))
+        if failures and enforce:
+            raise CommandError(f'{failures}个查询没有使用合适的索引')
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from posts.images import enqueue_variants, generate_variants
+from posts.models import PostImage
+
+class Command(BaseCommand):
+    help = '为已有图片生成缩略图和信息流尺寸的变体'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='重新生成所有图片的变体，包括已经生成过的')
+        parser.add_argument('--enqueue', action='store_true', help='只登记任务，交给run_image_worker处理')
+
+    def handle(self, *args, **options):
+        images = PostImage.objects.order_by('created_at')
+        if not options['force']:
+            images = images.filter(variants={})
+        done = failed = 0
+        for post_image in images.iterator(chunk_size=100):
+            if options['enqueue']:
+                enqueue_variants(post_image)
+                done += 1
+                continue
+            try:
+                generate_variants(post_image)
+                done += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'{post_image.pk}: {e}')
+        if options['enqueue']:
+            self.stdout.write(self.style.SUCCESS(f'已为{done}张图片登记变体生成任务'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'已生成{done}张图片的变体，失败{failed}张'))
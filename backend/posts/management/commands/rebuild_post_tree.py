@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from posts.tree import rebuild_tree
+
+class Command(BaseCommand):
+    help = '清空并根据帖子的父子关系重建帖子树（闭包表）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的行数')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_tree(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'帖子树已重建：{count}个帖子'))
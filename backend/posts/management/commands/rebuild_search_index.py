@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from posts.search import rebuild_index
+
+class Command(BaseCommand):
+    help = '清空并根据现有帖子重建全文搜索索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的索引行数')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_index(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'搜索索引已重建：{count}个帖子'))
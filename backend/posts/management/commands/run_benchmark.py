@@ -0,0 +1,241 @@
+import base64
+import http.client
+import json
+import logging
+import random
+import re
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+import rsa
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+from posts.models import Theme
+from users.models import User
+from .seed_benchmark_data import STUDENT_ID_PREFIX
+
+SCENARIOS = ['feed', 'reply_tree', 'messages', 'search', 'login']
+# 从RequestMetricsMiddleware输出的Server-Timing中读取查询次数
+QUERIES_RE = re.compile(r'(?:^|,\s*)db;[^,]*desc="(\d+) queries"')
+
+class InProcessClient:
+    """在当前进程内通过Django测试客户端发送请求，不经过网络"""
+
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, data=None, token=None):
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        if method == 'GET':
+            response = self.client.get(path, data, **headers)
+        else:
+            response = self.client.post(path, data, content_type='application/json', **headers)
+        return response.status_code, response.get('Server-Timing', ''), response.content
+
+    def close(self):
+        connections.close_all()
+
+class HttpClient:
+    """向运行中的服务发送HTTP请求，每个线程复用一个keep-alive连接"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.netloc, timeout=60)
+        self.prefix = parts.path.rstrip('/')
+
+    def request(self, method, path, data=None, token=None):
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        body = None
+        if method == 'GET':
+            if data:
+                path = f'{path}?{urlencode(data)}'
+        else:
+            body = json.dumps(data)
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            raise
+        return response.status, response.getheader('Server-Timing', ''), content
+
+    def close(self):
+        self.connection.close()
+
+class Command(BaseCommand):
+    help = ('并发请求信息流、回复树、消息、搜索和登录接口，以JSON输出各接口的p50/p95/p99延迟、吞吐量和每请求查询数；'
+            '默认在进程内请求，也可以用--base-url请求运行中的服务。需要先执行seed_benchmark_data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+        parser.add_argument('--requests', type=int, default=200, help='每个场景的请求数')
+        parser.add_argument('--concurrency', type=int, default=8, help='并发客户端数')
+        parser.add_argument('--warmup', type=int, default=10, help='每个场景正式计时前的预热请求数')
+        parser.add_argument('--base-url', help='如 http://127.0.0.1:8000 ，服务端需开启REQUEST_METRICS_ENABLED才能统计查询数')
+        parser.add_argument('--users', type=int, default=100, help='参与测试的用户数')
+        parser.add_argument('--password', default='benchmark', help='生成用户的密码，用于登录场景')
+        parser.add_argument('--output', help='结果写入的JSON文件，默认输出到标准输出')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.options = options
+        rng = random.Random(options['seed'])
+        self.prepare(rng)
+        if options['base_url']:
+            make_client = lambda: HttpClient(options['base_url'])
+            context = override_settings()
+        else:
+            make_client = InProcessClient
+            # 进程内请求时开启请求指标以统计查询数，并关闭逐请求的日志
+            context = override_settings(REQUEST_METRICS_ENABLED=True, REQUEST_METRICS_STRICT=False,
+                                        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
+            logging.getLogger('hetaoshu.metrics').setLevel(logging.ERROR)
+
+        with context:
+            public_key = self.fetch_public_key(make_client) if 'login' in options['scenarios'] else None
+            results = {}
+            for name in options['scenarios']:
+                make_request = getattr(self, f'make_{name}_request')
+                self.run(make_client, make_request, public_key, options['warmup'], rng)
+                results[name] = self.run(make_client, make_request, public_key, options['requests'], rng)
+                self.stderr.write(f'{name}: p50={results[name]["latency_ms"]["p50"]}ms  '
+                                  f'throughput={results[name]["throughput_rps"]}/s')
+
+        report = {
+            'commit': self.git_commit(),
+            'database': connection.vendor,
+            'mode': 'http' if options['base_url'] else 'in-process',
+            'concurrency': options['concurrency'],
+            'requests_per_scenario': options['requests'],
+            'scenarios': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def prepare(self, rng):
+        """从数据库中抽取测试用的用户、令牌、主题和搜索词"""
+        users = list(User.objects.filter(student_id__startswith=STUDENT_ID_PREFIX, is_active=True)
+                     .order_by('?')[:self.options['users']])
+        if not users:
+            raise CommandError('没有找到生成的用户，请先执行 manage.py seed_benchmark_data')
+        self.users = [(user.student_id, Token.objects.get_or_create(user=user)[0].key) for user in users]
+        self.theme_ids = [str(pk) for pk in Theme.objects.filter(is_active=True).order_by('?').values_list('id', flat=True)[:500]]
+        titles = Theme.objects.filter(is_active=True).order_by('?').values_list('title', flat=True)[:500]
+        self.search_words = []
+        for title in titles:
+            words = [word for word in title.split('，') if len(word) >= 2]
+            if words:
+                self.search_words.append(rng.choice(words))
+        # 工作线程各自建立数据库连接，主线程的连接不再使用
+        connections.close_all()
+
+    def fetch_public_key(self, make_client):
+        client = make_client()
+        try:
+            status, _, content = client.request('GET', '/api/users/public-key/')
+        finally:
+            client.close()
+        if status != 200:
+            raise CommandError(f'获取公钥失败：HTTP {status}')
+        return rsa.PublicKey.load_pkcs1(json.loads(content)['publicKey'].encode('utf-8'))
+
+    def make_feed_request(self, rng, public_key):
+        return 'GET', '/api/themes/', {'page_size': 24}, rng.choice(self.users)[1]
+
+    def make_reply_tree_request(self, rng, public_key):
+        return 'GET', f'/api/themes/{rng.choice(self.theme_ids)}/reply_tree/', None, rng.choice(self.users)[1]
+
+    def make_messages_request(self, rng, public_key):
+        return 'GET', '/api/messages/', {'page_size': 20}, rng.choice(self.users)[1]
+
+    def make_search_request(self, rng, public_key):
+        return 'GET', '/api/search/', {'q': rng.choice(self.search_words)}, rng.choice(self.users)[1]
+
+    def make_login_request(self, rng, public_key):
+        student_id, _ = rng.choice(self.users)
+        password = base64.b64encode(rsa.encrypt(self.options['password'].encode('utf-8'), public_key)).decode('ascii')
+        return 'POST', '/api/users/login/', {'student_id': student_id, 'password': password}, None
+
+    def run(self, make_client, make_request, public_key, total, rng):
+        """用concurrency个线程共发送total个请求，返回统计结果"""
+        concurrency = max(1, min(self.options['concurrency'], total or 1))
+        counts = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+        seeds = [rng.random() for _ in counts]
+        lock = threading.Lock()
+        latencies, queries, errors = [], [], []
+
+        def worker(count, seed):
+            thread_rng = random.Random(seed)
+            client = make_client()
+            try:
+                for _ in range(count):
+                    method, path, data, token = make_request(thread_rng, public_key)
+                    start = time.perf_counter()
+                    try:
+                        status, server_timing, _ = client.request(method, path, data, token)
+                    except Exception as e:
+                        with lock:
+                            errors.append(repr(e))
+                        continue
+                    elapsed = time.perf_counter() - start
+                    match = QUERIES_RE.search(server_timing)
+                    with lock:
+                        latencies.append(elapsed)
+                        if match:
+                            queries.append(int(match.group(1)))
+                        if status >= 400:
+                            errors.append(f'{method} {path}: HTTP {status}')
+            finally:
+                client.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            for future in [executor.submit(worker, count, seed) for count, seed in zip(counts, seeds)]:
+                future.result()
+        elapsed = time.perf_counter() - start
+        return self.summarize(latencies, queries, errors, elapsed)
+
+    def summarize(self, latencies, queries, errors, elapsed):
+        def percentile(values, p):
+            if not values:
+                return None
+            values = sorted(values)
+            return round(values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))] * 1000, 2)
+        return {
+            'requests': len(latencies),
+            'errors': len(errors),
+            'error_samples': sorted(set(errors))[:5],
+            'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+            'latency_ms': {
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'mean': round(statistics.mean(latencies) * 1000, 2) if latencies else None,
+                'max': percentile(latencies, 100),
+            },
+            'queries_per_request': {
+                'mean': round(statistics.mean(queries), 2) if queries else None,
+                'max': max(queries) if queries else None,
+            },
+        }
+
+    def git_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=settings.BASE_DIR, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,59 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+from django.db.models import Count
+from posts.images import claim_jobs, requeue_stale_jobs, run_job
+from posts.models import ImageJob
+
+class Command(BaseCommand):
+    help = '处理图片变体生成任务队列，使用与CPU核数相同数量的子进程'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='子进程数量，默认为CPU核数')
+        parser.add_argument('--poll-interval', type=float, default=2, help='队列为空时的轮询间隔（秒）')
+        parser.add_argument('--max-attempts', type=int, default=3, help='单个任务的最多尝试次数')
+        parser.add_argument('--stale-after', type=int, default=600, help='处理中超过该秒数的任务视为worker已退出，重新放回队列')
+        parser.add_argument('--once', action='store_true', help='处理完当前队列后退出')
+        parser.add_argument('--status', action='store_true', help='只显示各状态的任务数量')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            counts = dict(ImageJob.objects.order_by().values_list('status').annotate(count=Count('id')))
+            for status, label in ImageJob.STATUS_CHOICES:
+                self.stdout.write(f'{label}({status}): {counts.get(status, 0)}')
+            return
+
+        processes = options['processes']
+        # 子进程使用spawn方式启动，各自建立数据库连接，不与主进程共享连接
+        connections.close_all()
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=django.setup) as executor:
+            self.stdout.write(f'图片处理worker已启动，子进程数: {processes}')
+            while True:
+                try:
+                    requeue_stale_jobs(options['stale_after'])
+                    job_ids = claim_jobs(processes * 2)
+                except DatabaseError as e:
+                    # 数据库尚未就绪或连接中断时稍后重试
+                    self.stderr.write(f'读取任务队列失败: {e}')
+                    connections.close_all()
+                    time.sleep(options['poll_interval'])
+                    continue
+                if not job_ids:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                futures = [executor.submit(run_job, job_id, options['max_attempts']) for job_id in job_ids]
+                for job_id, future in zip(job_ids, futures):
+                    # 单个任务的异常不影响其他任务和worker本身，任务保持处理中，超时后重新放回队列
+                    try:
+                        status = future.result()
+                    except Exception as e:
+                        self.stderr.write(f'任务{job_id}执行失败: {e!r}')
+                        continue
+                    self.stdout.write(f'任务{job_id}: {status or "已删除"}')
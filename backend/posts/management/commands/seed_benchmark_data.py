@@ -0,0 +1,209 @@
+import io
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+from posts.images import generate_variants
+from posts.models import ImageJob, Post, PostClosure, PostImage, SearchToken, Theme
+from posts.search import post_tokens
+from posts.tree import thread_links
+from users.models import User, VerificationCode
+
+# 生成的用户学号均以此为前缀，--clear 据此删除上次生成的数据
+STUDENT_ID_PREFIX = 'seed'
+PLACEHOLDER_DIR = 'post_images/seed'
+CHARS = '的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处府研'
+ASCII_WORDS = ['python', 'django', 'react', 'mysql', 'linux', 'iphone', 'switch', 'gpu', 'java', 'docker']
+
+@contextmanager
+def explicit_timestamps(*models):
+    """临时关闭auto_now/auto_now_add，使批量写入时可以指定创建和更新时间"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+class Command(BaseCommand):
+    help = '向本地数据库写入基准测试数据：用户、主题、带回复链的帖子、帖子树、图片、搜索索引和验证码（用户共用同一个密码）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--themes', type=int, default=100000)
+        parser.add_argument('--posts', type=int, default=1000000, help='帖子总数，包括每个主题的根帖子')
+        parser.add_argument('--image-ratio', type=float, default=0.3, help='带图片的帖子比例')
+        parser.add_argument('--chain-ratio', type=float, default=0.5, help='回复接在主题最新帖子下（形成回复链）的比例')
+        parser.add_argument('--days', type=int, default=90, help='主题创建时间分布在最近多少天内')
+        parser.add_argument('--password', default='benchmark', help='所有生成用户的密码')
+        parser.add_argument('--batch-size', type=int, default=500, help='每批写入的主题数')
+        parser.add_argument('--skip-search-index', action='store_true', help='不写入搜索索引')
+        parser.add_argument('--clear', action='store_true', help='先删除上次生成的数据')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['posts'] < options['themes']:
+            raise CommandError('帖子数不能少于主题数，每个主题至少有一个根帖子')
+        seeded = User.objects.filter(student_id__startswith=STUDENT_ID_PREFIX)
+        if options['clear']:
+            self.clear(seeded)
+        elif seeded.exists():
+            raise CommandError('数据库中已有生成的数据，使用 --clear 重新生成')
+
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        start = time.perf_counter()
+        with explicit_timestamps(User, Theme, Post, PostImage):
+            user_ids = self.create_users(options)
+            self.placeholders = self.create_placeholders()
+            self.create_threads(user_ids, options)
+        self.stdout.write(self.style.SUCCESS(f'基准测试数据已生成，耗时{time.perf_counter() - start:.0f}s'))
+
+    def clear(self, seeded):
+        """按依赖顺序删除生成的数据，避免逐行级联"""
+        posts = Post.objects.filter(author__in=seeded)
+        with transaction.atomic():
+            Theme.objects.filter(author__in=seeded).update(first_post=None)
+            SearchToken.objects.filter(post__in=posts).delete()
+            PostClosure.objects.filter(descendant__in=posts).delete()
+            ImageJob.objects.filter(image__post__in=posts).delete()
+            PostImage.objects.filter(post__in=posts).delete()
+            # 先断开回复关系，删除帖子时无需逐层查找子回复
+            posts.update(parent=None)
+            posts.delete()
+            Theme.objects.filter(author__in=seeded).delete()
+            seeded.delete()
+        self.stdout.write('已删除上次生成的数据')
+
+    def text(self, words):
+        parts = []
+        for _ in range(words):
+            if self.rng.random() < 0.05:
+                parts.append(self.rng.choice(ASCII_WORDS))
+            else:
+                parts.append(''.join(self.rng.choice(CHARS) for _ in range(self.rng.randint(2, 4))))
+        return '，'.join(parts)
+
+    def create_users(self, options):
+        # 所有用户共用一个密码哈希，避免为每个用户计算一次PBKDF2
+        password = make_password(options['password'])
+        users = [
+            User(
+                student_id=f'{STUDENT_ID_PREFIX}{i}', email=f'{STUDENT_ID_PREFIX}{i}@bench.local',
+                name=f'用户{i}', password=password, date_joined=self.now - timedelta(days=options['days']),
+            )
+            for i in range(options['users'])
+        ]
+        User.objects.bulk_create(users, batch_size=1000)
+        self.stdout.write(f'已创建{len(users)}个用户')
+        user_ids = list(User.objects.filter(student_id__startswith=STUDENT_ID_PREFIX).values_list('id', flat=True))
+        # 每个用户几条验证码，大多已使用或已过期；bulk_create不经过save，验证码在这里生成
+        VerificationCode.objects.bulk_create([
+            VerificationCode(
+                user_id=user_id, code=f'{self.rng.randrange(10 ** 6):06d}', is_used=self.rng.random() < 0.8,
+                expires_at=self.now + timedelta(minutes=self.rng.randint(-7 * 24 * 60, 60)),
+            )
+            for user_id in user_ids for _ in range(self.rng.randint(1, 3))
+        ], batch_size=1000)
+        return user_ids
+
+    def create_placeholders(self):
+        """生成几张不同尺寸的占位图片及其变体，所有生成的图片记录共用这些文件"""
+        placeholders = []
+        for i, size in enumerate([(1080, 1440), (1440, 1080), (1080, 1080), (720, 1280)]):
+            buffer = io.BytesIO()
+            Image.new('RGB', size, (40 * i, 120, 200)).save(buffer, format='JPEG', quality=80)
+            name = default_storage.save(f'{PLACEHOLDER_DIR}/placeholder-{i}.jpg', ContentFile(buffer.getvalue()))
+            placeholders.append((name, size))
+        return placeholders
+
+    def create_threads(self, user_ids, options):
+        rng = self.rng
+        themes_total = options['themes']
+        # 回复在主题间的分布不均匀，少数主题有大量回复
+        weights = [rng.paretovariate(1.2) for _ in range(themes_total)]
+        reply_counts = [0] * themes_total
+        for index in rng.choices(range(themes_total), weights=weights, k=options['posts'] - themes_total):
+            reply_counts[index] += 1
+        variants = {}
+        created = 0
+        for offset in range(0, themes_total, options['batch_size']):
+            with transaction.atomic():
+                created += self.create_batch(range(offset, min(offset + options['batch_size'], themes_total)), reply_counts, user_ids, variants, options)
+            self.stdout.write(f'已创建{min(offset + options["batch_size"], themes_total)}个主题，{created}个帖子')
+
+    def create_batch(self, indexes, reply_counts, user_ids, variants, options):
+        rng = self.rng
+        themes, posts, images = [], [], []
+        threads = []
+        for index in indexes:
+            created_at = self.now - timedelta(seconds=rng.uniform(0, options['days'] * 86400))
+            title = self.text(rng.randint(2, 4))[:100]
+            theme = Theme(
+                title=title, description=self.text(rng.randint(3, 10)), author_id=rng.choice(user_ids),
+                theme_type=rng.choice(Theme.THEME_TYPES)[0], created_at=created_at, updated_at=created_at,
+            )
+            root = Post(title=title, content=self.text(rng.randint(5, 20)), author_id=theme.author_id,
+                        theme=theme, created_at=created_at, updated_at=created_at)
+            thread = [root]
+            for _ in range(reply_counts[index]):
+                parent = thread[-1] if rng.random() < options['chain_ratio'] else rng.choice(thread)
+                # 回复时间晚于父帖子，但不晚于当前时间
+                reply_at = min(parent.created_at + timedelta(seconds=rng.expovariate(1 / 3600)), self.now)
+                reply = Post(content=self.text(rng.randint(1, 10)), author_id=rng.choice(user_ids), theme=theme,
+                             parent=parent, created_at=reply_at, updated_at=reply_at)
+                parent.reply_count += 1
+                thread.append(reply)
+            theme.post_count = len(thread)
+            for post in thread:
+                if rng.random() < options['image_ratio']:
+                    post.image_count = rng.randint(1, 3)
+                    for order in range(post.image_count):
+                        name, (width, height) = rng.choice(self.placeholders)
+                        images.append(PostImage(post=post, image=name, order=order, width=width, height=height,
+                                                variants=variants.get(name, {}), created_at=post.created_at))
+            themes.append(theme)
+            posts.extend(thread)
+            threads.append([(post.pk, post.parent_id) for post in thread])
+
+        Theme.objects.bulk_create(themes)
+        # 帖子按主题内的生成顺序写入，父帖子总在子回复之前
+        Post.objects.bulk_create(posts, batch_size=1000)
+        for post in posts:
+            if post.parent_id is None:
+                post.theme.first_post_id = post.pk
+        Theme.objects.bulk_update(themes, ['first_post'])
+        PostClosure.objects.bulk_create(
+            [link for thread in threads for link in thread_links(thread)], batch_size=5000
+        )
+        PostImage.objects.bulk_create(images, batch_size=1000)
+        self.ensure_variants(images, variants)
+        if not options['skip_search_index']:
+            SearchToken.objects.bulk_create([
+                SearchToken(token=token, post=post, weight=weight)
+                for post in posts for token, weight in post_tokens(post).items()
+            ], batch_size=5000)
+        return len(posts)
+
+    def ensure_variants(self, images, variants):
+        """每张占位图片只生成一次变体，之后的图片记录直接复用"""
+        missing = [image for image in images if not image.variants]
+        for image in missing:
+            name = image.image.name
+            if name not in variants:
+                variants[name] = generate_variants(image)
+            image.variants = variants[name]
+        PostImage.objects.bulk_update(missing, ['variants'])
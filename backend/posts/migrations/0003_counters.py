@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:17
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    """按现有数据填充新增的计数字段，与posts.counters.rebuild_counters相同"""
+    Post = apps.get_model('posts', 'Post')
+    PostImage = apps.get_model('posts', 'PostImage')
+    Theme = apps.get_model('posts', 'Theme')
+    counters = [
+        (Post, 'reply_count', Post.objects.filter(is_active=True, parent__isnull=False).order_by().values_list('parent')),
+        (Post, 'image_count', PostImage.objects.order_by().values_list('post')),
+        (Theme, 'post_count', Post.objects.filter(is_active=True).order_by().values_list('theme')),
+    ]
+    for model, field, rows in counters:
+        objs = [model(pk=pk, **{field: count}) for pk, count in rows.annotate(count=Count('id'))]
+        model.objects.bulk_update(objs, [field], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='图片数'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='回复数'),
+        ),
+        migrations.AddField(
+            model_name='theme',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='帖子数'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
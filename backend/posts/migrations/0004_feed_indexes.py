@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['is_active', 'parent', 'created_at', 'id'], name='post_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='theme',
+            index=models.Index(fields=['is_active', 'created_at', 'id'], name='theme_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='theme',
+            index=models.Index(fields=['author', 'is_active', 'created_at', 'id'], name='theme_author_feed_idx'),
+        ),
+    ]
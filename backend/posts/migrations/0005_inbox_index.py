@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['parent', 'is_active', 'created_at', 'author'], name='post_inbox_idx'),
+        ),
+    ]
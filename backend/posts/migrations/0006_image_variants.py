@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_inbox_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postimage',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='高度'),
+        ),
+        migrations.AddField(
+            model_name='postimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, verbose_name='图片变体'),
+        ),
+        migrations.AddField(
+            model_name='postimage',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='宽度'),
+        ),
+    ]
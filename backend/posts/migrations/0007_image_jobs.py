@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', '等待处理'), ('running', '处理中'), ('done', '已完成'), ('failed', '失败')], default='pending', max_length=20, verbose_name='状态')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='尝试次数')),
+                ('error', models.TextField(blank=True, default='', verbose_name='错误信息')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='job', to='posts.postimage', verbose_name='图片')),
+            ],
+            options={
+                'verbose_name': '图片处理任务',
+                'verbose_name_plural': '图片处理任务',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='imagejob_status_idx')],
+            },
+        ),
+    ]
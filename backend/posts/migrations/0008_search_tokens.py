@@ -0,0 +1,89 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:28
+
+import re
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# 分词逻辑复制自本迁移编写时的posts/search.py，之后修改分词规则不影响本迁移；
+# 修改规则后用 manage.py rebuild_search_index 重建索引
+TOKEN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[0-9A-Za-z]+')
+CJK_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+MAX_TOKEN_LENGTH = 32
+TITLE_WEIGHT = 3
+DESCRIPTION_WEIGHT = 2
+CONTENT_WEIGHT = 1
+
+
+def tokenize(text):
+    tokens = []
+    for run in TOKEN_RE.findall(text or ''):
+        if CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower()[:MAX_TOKEN_LENGTH])
+    return tokens
+
+
+def post_tokens(post):
+    weights = Counter()
+    if post.parent_id is None:
+        theme = post.theme
+        fields = [(theme.title, TITLE_WEIGHT), (theme.description, DESCRIPTION_WEIGHT)]
+    else:
+        fields = [(post.title, TITLE_WEIGHT)]
+    fields.append((post.content, CONTENT_WEIGHT))
+    for text, weight in fields:
+        for token in tokenize(text):
+            weights[token] += weight
+    return weights
+
+
+def backfill_search_tokens(apps, schema_editor, batch_size=1000):
+    """为已有帖子建立索引，结果与编写本迁移时的manage.py rebuild_search_index相同"""
+    Post = apps.get_model('posts', 'Post')
+    SearchToken = apps.get_model('posts', 'SearchToken')
+    batch = []
+    posts = Post.objects.filter(is_active=True).select_related('theme').order_by('pk')
+    for post in posts.iterator(chunk_size=batch_size):
+        batch.extend(
+            SearchToken(token=token, post=post, weight=weight)
+            for token, weight in post_tokens(post).items()
+        )
+        if len(batch) >= batch_size:
+            SearchToken.objects.bulk_create(batch)
+            batch = []
+    SearchToken.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_image_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=32, verbose_name='词元')),
+                ('weight', models.PositiveIntegerField(default=1, verbose_name='权重')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='posts.post', verbose_name='帖子')),
+            ],
+            options={
+                'verbose_name': '搜索索引',
+                'verbose_name_plural': '搜索索引',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchtoken',
+            constraint=models.UniqueConstraint(fields=('token', 'post'), name='searchtoken_token_post_uniq'),
+        ),
+        migrations.RunPython(backfill_search_tokens, migrations.RunPython.noop),
+    ]
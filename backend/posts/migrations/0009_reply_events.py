@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:43
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0008_search_tokens'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplyEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('payload', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='事件内容')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reply_events', to='posts.post', verbose_name='回复')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reply_events', to=settings.AUTH_USER_MODEL, verbose_name='接收者')),
+            ],
+            options={
+                'verbose_name': '回复通知',
+                'verbose_name_plural': '回复通知',
+                'indexes': [models.Index(fields=['recipient', 'id'], name='replyevent_recipient_idx'), models.Index(fields=['created_at'], name='replyevent_created_idx')],
+            },
+        ),
+    ]
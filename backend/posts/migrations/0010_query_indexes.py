@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_reply_events'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['theme', 'created_at', 'is_active'], name='post_theme_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postimage',
+            index=models.Index(fields=['post', 'order'], name='postimage_post_order_idx'),
+        ),
+    ]
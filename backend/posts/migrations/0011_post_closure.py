@@ -0,0 +1,68 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:04
+
+from collections import defaultdict
+from itertools import groupby
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# 遍历逻辑复制自本迁移编写时的posts/tree.py，之后修改posts/tree.py不影响本迁移
+def thread_links(PostClosure, posts):
+    """一个主题的帖子[(id, parent_id)]在闭包表中的全部行"""
+    ids = {pk for pk, _ in posts}
+    children = defaultdict(list)
+    for pk, parent_id in posts:
+        # 父帖子不在本主题中时按根帖子处理
+        children[parent_id if parent_id in ids else None].append(pk)
+    stack = [(pk, ()) for pk in children[None]]
+    while stack:
+        pk, chain = stack.pop()
+        chain += (pk,)
+        for depth, ancestor_id in enumerate(reversed(chain)):
+            yield PostClosure(ancestor_id=ancestor_id, descendant_id=pk, depth=depth)
+        stack.extend((child, chain) for child in children.get(pk, ()))
+
+
+def backfill_post_closure(apps, schema_editor, batch_size=1000):
+    """为已有帖子写入闭包表（自身一行及到每个祖先各一行），结果与编写本迁移时的manage.py rebuild_post_tree相同"""
+    Post = apps.get_model('posts', 'Post')
+    PostClosure = apps.get_model('posts', 'PostClosure')
+    batch = []
+    posts = Post.objects.order_by('theme_id').values_list('theme_id', 'pk', 'parent_id')
+    for _, thread in groupby(posts.iterator(chunk_size=batch_size), key=lambda row: row[0]):
+        for link in thread_links(PostClosure, [(pk, parent_id) for _, pk, parent_id in thread]):
+            batch.append(link)
+            if len(batch) >= batch_size:
+                PostClosure.objects.bulk_create(batch)
+                batch = []
+    PostClosure.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostClosure',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('depth', models.PositiveIntegerField(verbose_name='层数')),
+                ('ancestor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='posts.post', verbose_name='祖先')),
+                ('descendant', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='posts.post', verbose_name='后代')),
+            ],
+            options={
+                'verbose_name': '帖子树',
+                'verbose_name_plural': '帖子树',
+                'indexes': [models.Index(fields=['ancestor', 'depth'], name='postclosure_subtree_idx'), models.Index(fields=['descendant', 'depth'], name='postclosure_ancestors_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='postclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='postclosure_pair_uniq'),
+        ),
+        migrations.RunPython(backfill_post_closure, migrations.RunPython.noop),
+    ]
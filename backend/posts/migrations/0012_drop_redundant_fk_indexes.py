@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# 这些外键已有以其列开头的复合索引，查询和外键约束（MySQL要求外键列上有索引）都可以使用复合索引，
+# 单列索引只增加写入和存储开销
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0011_post_closure'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='parent',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='posts.post', verbose_name='父帖子'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='theme',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='posts', to='posts.theme', verbose_name='主题帖'),
+        ),
+        migrations.AlterField(
+            model_name='postimage',
+            name='post',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='images', to='posts.post', verbose_name='帖子'),
+        ),
+        migrations.AlterField(
+            model_name='replyevent',
+            name='recipient',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='reply_events', to=settings.AUTH_USER_MODEL, verbose_name='接收者'),
+        ),
+        migrations.AlterField(
+            model_name='theme',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='themes', to=settings.AUTH_USER_MODEL, verbose_name='作者'),
+        ),
+    ]
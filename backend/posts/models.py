@@ -1,8 +1,30 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 import uuid
 from django.utils import timezone
 
+class ThemeQuerySet(models.QuerySet):
+    def for_feed(self):
+        """一次性取出主题列表所需的关联数据，避免逐行查询"""
+        return self.select_related('author', 'first_post').prefetch_related(
+            models.Prefetch('first_post__images', queryset=PostImage.objects.order_by('order'))
+        )
+
+class PostQuerySet(models.QuerySet):
+    def for_detail(self, theme=True):
+        """一次性取出PostSerializer所需的作者、父帖子、图片和所属主题（theme为False时不取主题），避免逐行查询"""
+        if not theme:
+            return self.select_related('author', 'parent').prefetch_related('images')
+        return self.select_related('author', 'parent', 'theme__author', 'theme__first_post').prefetch_related(
+            'images',
+            models.Prefetch('theme__first_post__images', queryset=PostImage.objects.order_by('order')),
+        )
+
+    def received_by(self, user, since):
+        """user在since之后收到的有效回复（父帖子的作者是user），不含自己回复自己"""
+        return self.filter(parent__author=user, is_active=True, created_at__gt=since).exclude(author=user)
+
 class Theme(models.Model):
     THEME_TYPES = (
         ('share', '分享'),
@@ -14,18 +36,26 @@ class Theme(models.Model):
     title = models.CharField(max_length=100, verbose_name='主题帖标题')
     theme_type = models.CharField(max_length=20, choices=THEME_TYPES, default='share', verbose_name='主题帖类型')
     description = models.TextField(blank=True, null=True, verbose_name='主题帖描述')
-    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='themes', verbose_name='作者')
+    # 外键的单列索引由theme_author_feed_idx代替，下同：以外键列开头的复合索引可以用于同样的查询和外键约束
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='themes', db_index=False, verbose_name='作者')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
     is_active = models.BooleanField(default=True, verbose_name='是否有效')
     valid_until = models.DateTimeField(null=True, blank=True, verbose_name='有效期到')
     first_post = models.ForeignKey('Post', null=True, blank=True, on_delete=models.SET_NULL, related_name='theme_first_post', verbose_name='第一个帖子')
+    post_count = models.PositiveIntegerField(default=0, verbose_name='帖子数')
 
+    objects = ThemeQuerySet.as_manager()
     
     class Meta:
         verbose_name = '主题帖'
         verbose_name_plural = '主题帖'
         ordering = ['-created_at']
+        indexes = [
+            # 信息流游标分页：按(created_at, id)倒序扫描
+            models.Index(fields=['is_active', 'created_at', 'id'], name='theme_feed_idx'),
+            models.Index(fields=['author', 'is_active', 'created_at', 'id'], name='theme_author_feed_idx'),
+        ]
     def __str__(self):
         return self.title
 
@@ -37,22 +67,122 @@ class Post(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
     is_active = models.BooleanField(default=True, verbose_name='是否有效')
-    theme = models.ForeignKey(Theme, blank=False, null=False, on_delete=models.CASCADE, related_name='posts', verbose_name='主题帖')
-    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='replies', verbose_name='父帖子')
-    
+    # 由post_theme_idx、post_inbox_idx代替单列索引
+    theme = models.ForeignKey(Theme, blank=False, null=False, on_delete=models.CASCADE, related_name='posts', db_index=False, verbose_name='主题帖')
+    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='replies', db_index=False, verbose_name='父帖子')
+    reply_count = models.PositiveIntegerField(default=0, verbose_name='回复数')
+    image_count = models.PositiveIntegerField(default=0, verbose_name='图片数')
+
+    objects = PostQuerySet.as_manager()
+
     class Meta:
         verbose_name = '帖子'
         verbose_name_plural = '帖子'
         ordering = ['-created_at']
+        indexes = [
+            # 帖子信息流（parent为空的根帖子）游标分页
+            models.Index(fields=['is_active', 'parent', 'created_at', 'id'], name='post_feed_idx'),
+            # 消息查询：按父帖子找出某时间之后的回复，author用于排除自己的回复
+            models.Index(fields=['parent', 'is_active', 'created_at', 'author'], name='post_inbox_idx'),
+            # 回复树：按主题取出全部帖子，顺序与默认排序一致，无需再排序；is_active在索引中过滤
+            models.Index(fields=['theme', 'created_at', 'is_active'], name='post_theme_idx'),
+        ]
 
 class PostImage(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='images', verbose_name='帖子')
+    # 由postimage_post_order_idx代替单列索引
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='images', db_index=False, verbose_name='帖子')
     image = models.ImageField(upload_to='post_images/', verbose_name='图片')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     order = models.PositiveIntegerField(default=0, verbose_name='排序')
+    width = models.PositiveIntegerField(null=True, blank=True, verbose_name='宽度')
+    height = models.PositiveIntegerField(null=True, blank=True, verbose_name='高度')
+    # 缩略图等变体：{变体名: {格式: {'path': 路径, 'width': 宽, 'height': 高}}}
+    variants = models.JSONField(default=dict, blank=True, verbose_name='图片变体')
     
     class Meta:
         verbose_name = '帖子图片'
         verbose_name_plural = '帖子图片'
         ordering = ['order']
+        indexes = [
+            # 按帖子取图片，顺序与默认排序一致
+            models.Index(fields=['post', 'order'], name='postimage_post_order_idx'),
+        ]
+
+class PostClosure(models.Model):
+    """帖子树的闭包表：每个帖子与它的每个祖先（包括自己）各一行，depth为两者相差的层数
+
+    子树、限定深度的后代和祖先链都只需在索引上做一次范围查询，见posts/tree.py。
+    """
+    id = models.BigAutoField(primary_key=True)
+    # 外键的单列索引被下面以它开头的复合索引覆盖，不再单独创建
+    ancestor = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='descendant_links', db_index=False, verbose_name='祖先')
+    descendant = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='ancestor_links', db_index=False, verbose_name='后代')
+    depth = models.PositiveIntegerField(verbose_name='层数')
+
+    class Meta:
+        verbose_name = '帖子树'
+        verbose_name_plural = '帖子树'
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='postclosure_pair_uniq'),
+        ]
+        indexes = [
+            # 子树及限定深度的后代：按祖先和层数范围扫描
+            models.Index(fields=['ancestor', 'depth'], name='postclosure_subtree_idx'),
+            # 祖先链：按后代取出，层数即离该帖子的距离
+            models.Index(fields=['descendant', 'depth'], name='postclosure_ancestors_idx'),
+        ]
+
+class ImageJob(models.Model):
+    """图片变体生成任务，保存在数据库中，进程重启后仍会继续处理"""
+    STATUS_CHOICES = (
+        ('pending', '等待处理'),
+        ('running', '处理中'),
+        ('done', '已完成'),
+        ('failed', '失败'),
+    )
+    image = models.OneToOneField(PostImage, on_delete=models.CASCADE, related_name='job', verbose_name='图片')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='状态')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='尝试次数')
+    error = models.TextField(blank=True, default='', verbose_name='错误信息')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '图片处理任务'
+        verbose_name_plural = '图片处理任务'
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='imagejob_status_idx'),
+        ]
+
+class SearchToken(models.Model):
+    """搜索倒排索引：每个帖子的每个词元一行，weight为词频乘以字段权重"""
+    token = models.CharField(max_length=32, verbose_name='词元')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='search_tokens', verbose_name='帖子')
+    weight = models.PositiveIntegerField(default=1, verbose_name='权重')
+
+    class Meta:
+        verbose_name = '搜索索引'
+        verbose_name_plural = '搜索索引'
+        constraints = [
+            models.UniqueConstraint(fields=['token', 'post'], name='searchtoken_token_post_uniq'),
+        ]
+
+class ReplyEvent(models.Model):
+    """回复通知的发件箱：回复帖子时在同一事务中写入，各进程按自增id轮询后推送给在线的接收者"""
+    id = models.BigAutoField(primary_key=True)
+    # 由replyevent_recipient_idx代替单列索引
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reply_events', db_index=False, verbose_name='接收者')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='reply_events', verbose_name='回复')
+    # 推送的事件内容，写入时生成，推送时不再查询其他表
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder, verbose_name='事件内容')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        verbose_name = '回复通知'
+        verbose_name_plural = '回复通知'
+        indexes = [
+            # 断线重连时按Last-Event-ID补发某个用户的事件
+            models.Index(fields=['recipient', 'id'], name='replyevent_recipient_idx'),
+            models.Index(fields=['created_at'], name='replyevent_created_idx'),
+        ]
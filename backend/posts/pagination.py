@@ -0,0 +1,141 @@
+import base64
+import binascii
+import uuid
+from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# 自定义分页类
+class PostPagination(PageNumberPagination):
+    page_size = 24  # 每页显示20条
+    page_size_query_param = 'page_size'
+    max_page_size = 60
+
+class FeedPagination(BasePagination):
+    """按(created_at, id)倒序的游标分页
+
+    下一页只需在复合索引上做一次范围扫描，不做COUNT，也不随翻页深度变慢。
+    请求带有page参数时退回PostPagination页码分页，兼容旧版前端。
+    """
+    page_size = PostPagination.page_size
+    page_size_query_param = PostPagination.page_size_query_param
+    max_page_size = PostPagination.max_page_size
+    cursor_query_param = 'cursor'
+    page_query_param = PostPagination.page_query_param
+    invalid_cursor_message = '无效的游标'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_paginator = None
+        if self.page_query_param in request.query_params:
+            self.page_paginator = PostPagination()
+            return self.page_paginator.paginate_queryset(queryset, request, view)
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset的异步版本，供异步视图使用"""
+        self.request = request
+        self.page_paginator = None
+        if self.page_query_param in request.query_params:
+            self.page_paginator = PostPagination()
+            return await sync_to_async(self.page_paginator.paginate_queryset)(queryset, request, view)
+        return self.set_page([obj async for obj in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        """当前页的查询集，多取一条用于判断是否还有下一页"""
+        self.current_page_size = self.get_page_size(request)
+        queryset = queryset.order_by('-created_at', '-id')
+        cursor = self.decode_cursor(request)
+        if cursor:
+            created_at, pk = cursor
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        return queryset[:self.current_page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.current_page_size
+        self.page = results[:self.current_page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        if self.page_paginator is not None:
+            return self.page_paginator.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(last.created_at, last.id))
+
+    def get_previous_link(self):
+        # 信息流只向后翻页
+        return None
+
+    def encode_cursor(self, created_at, pk):
+        value = f'{created_at.isoformat()}|{pk.hex}'
+        return base64.urlsafe_b64encode(value.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            created_at, pk = value.split('|')
+            return datetime.fromisoformat(created_at), uuid.UUID(pk)
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+class SearchPagination(BasePagination):
+    """搜索结果的页码分页
+
+    结果按相关度排序，无法使用游标；每页多取一条判断是否有下一页，不做COUNT。
+    """
+    page_size = PostPagination.page_size
+    page_size_query_param = PostPagination.page_size_query_param
+    max_page_size = PostPagination.max_page_size
+    page_query_param = PostPagination.page_query_param
+    # 相关度靠后的结果意义不大，限制最大页数以免深翻页扫描过多行
+    max_page = 50
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        try:
+            self.page_number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound('无效的页码')
+        if not 1 <= self.page_number <= self.max_page:
+            raise NotFound('无效的页码')
+        offset = (self.page_number - 1) * page_size
+        results = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(results) > page_size and self.page_number < self.max_page
+        return results[:page_size]
+
+    get_page_size = FeedPagination.get_page_size
+
+    def get_paginated_response(self, data):
+        next_link = None
+        if self.has_next:
+            next_link = replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.page_number + 1)
+        return Response({
+            'next': next_link,
+            'results': data,
+        })
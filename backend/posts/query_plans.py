@@ -0,0 +1,94 @@
+import json
+import re
+from django.db import connection
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework.request import Request
+from users.models import VerificationCode
+from .models import Post, PostImage, Theme
+from .pagination import FeedPagination
+from .serializers import reply_tree_images, reply_tree_posts
+from .tree import ancestors, descendants
+
+# 热点查询的执行计划检查，供 posts/tests.py 和 manage.py check_query_plans 使用。
+# 只在MySQL上判定：SQLite的EXPLAIN QUERY PLAN与MySQL差别较大，
+# Django在SQLite上把布尔条件写成裸列（WHERE is_active），SQLite无法用它匹配以布尔列开头的索引
+
+# MySQL对小表可能直接全表扫描，预计扫描行数少于此值的表不算作全表扫描
+MIN_ROWS = 1000
+
+# SQLite的EXPLAIN QUERY PLAN中，不带USING的SCAN为全表扫描，USE TEMP B-TREE FOR ... ORDER BY为额外排序
+SQLITE_FULL_SCAN = re.compile(r'\bSCAN (?:TABLE )?(\w+)(?! USING)(?:\s|$)')
+SQLITE_FILESORT = re.compile(r'USE TEMP B-TREE FOR (?:RIGHT PART OF |LAST TERM OF )?ORDER BY')
+
+def feed_page(queryset, cursor=None):
+    """FeedPagination实际执行的分页查询，cursor为(created_at, id)时取其后一页"""
+    paginator = FeedPagination()
+    params = {paginator.cursor_query_param: paginator.encode_cursor(*cursor)} if cursor else {}
+    return paginator.page_queryset(queryset, Request(RequestFactory().get('/', params)))
+
+def middle_cursor(queryset):
+    """信息流中间位置的游标，检查翻页后的范围扫描"""
+    return queryset.order_by('-created_at', '-id').values_list('created_at', 'id')[queryset.count() // 2]
+
+def hot_queries(code_filter=None):
+    """[(名称, 查询集, 是否允许额外排序)]，数据不足时返回None；code_filter限定用于检查的验证码"""
+    code = VerificationCode.objects.filter(**(code_filter or {})).first()
+    theme = Theme.objects.filter(is_active=True, first_post__isnull=False).order_by('-post_count').first()
+    image = PostImage.objects.order_by('-post__image_count').first()
+    deepest = Post.objects.filter(ancestor_links__isnull=False).order_by('-ancestor_links__depth').first()
+    if code is None or theme is None or image is None or deepest is None:
+        return None
+
+    themes = Theme.objects.filter(is_active=True).for_feed().order_by('-created_at')
+    posts = Post.objects.filter(is_active=True, parent__isnull=True).for_detail(theme=False).order_by('-created_at')
+    return [
+        ('主题信息流', feed_page(themes), False),
+        ('主题信息流翻页', feed_page(themes, middle_cursor(themes)), False),
+        ('帖子信息流', feed_page(posts), False),
+        ('帖子信息流翻页', feed_page(posts, middle_cursor(posts)), False),
+        ('回复树帖子', reply_tree_posts(theme), False),
+        # 主题内各帖子的图片合在一起按order排序，排序的只是该主题的图片
+        ('回复树图片', reply_tree_images(theme), True),
+        # 子树按发布时间分页，排序的只是该帖子的后代
+        ('帖子子树', feed_page(descendants(theme.first_post, 2).filter(is_active=True)), True),
+        ('祖先链', ancestors(deepest), False),
+        ('帖子图片', image.post.images.all(), False),
+        ('验证码', VerificationCode.objects.filter(
+            user_id=code.user_id, code=code.code, is_used=False, expires_at__gt=timezone.now(),
+        ), False),
+    ]
+
+def plan_problems(queryset, allow_filesort=False, min_rows=MIN_ROWS):
+    """执行计划中的问题列表（全表扫描、额外排序），没有问题时为空"""
+    if connection.vendor == 'mysql':
+        full_scans, filesort = explain_mysql(queryset, min_rows)
+    else:
+        full_scans, filesort = explain_sqlite(queryset)
+    problems = [f'全表扫描 {table}' for table in full_scans]
+    if filesort and not allow_filesort:
+        problems.append('额外排序（filesort）')
+    return problems
+
+def explain_mysql(queryset, min_rows):
+    plan = json.loads(queryset.explain(format='JSON'))
+    full_scans, filesort = [], False
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, list):
+            nodes.extend(node)
+            continue
+        if not isinstance(node, dict):
+            continue
+        if node.get('access_type') == 'ALL' and node.get('rows_examined_per_scan', 0) >= min_rows:
+            full_scans.append(node.get('table_name'))
+        if node.get('using_filesort'):
+            filesort = True
+        nodes.extend(node.values())
+    return full_scans, filesort
+
+def explain_sqlite(queryset):
+    plan = queryset.explain()
+    full_scans = [match.group(1) for line in plan.splitlines() for match in SQLITE_FULL_SCAN.finditer(line)]
+    return full_scans, bool(SQLITE_FILESORT.search(plan))
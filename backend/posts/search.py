@@ -0,0 +1,102 @@
+import re
+from collections import Counter
+from django.db.models import Count, Q, Sum
+from .models import Post, SearchToken
+
+# 本地维护的倒排索引：中文按相邻两字切分（bigram），单独出现的汉字保留为单字；
+# 英文和数字按连续字母数字切分并转为小写。不依赖MySQL的ngram分词插件，SQLite下同样可用
+
+TOKEN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[0-9A-Za-z]+')
+CJK_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+MAX_TOKEN_LENGTH = SearchToken._meta.get_field('token').max_length
+# 查询最多使用的词元数，避免超长查询生成过大的IN条件
+MAX_QUERY_TOKENS = 32
+
+# 字段权重：标题命中比正文命中更相关
+TITLE_WEIGHT = 3
+DESCRIPTION_WEIGHT = 2
+CONTENT_WEIGHT = 1
+
+def tokenize(text):
+    """把文本切分为词元列表，保留重复以便统计词频"""
+    tokens = []
+    for run in TOKEN_RE.findall(text or ''):
+        if CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower()[:MAX_TOKEN_LENGTH])
+    return tokens
+
+def post_tokens(post):
+    """帖子各字段的词元及权重；根帖子额外索引所属主题的标题和描述"""
+    weights = Counter()
+    if post.parent_id is None:
+        theme = post.theme
+        fields = [(theme.title, TITLE_WEIGHT), (theme.description, DESCRIPTION_WEIGHT)]
+    else:
+        fields = [(post.title, TITLE_WEIGHT)]
+    fields.append((post.content, CONTENT_WEIGHT))
+    for text, weight in fields:
+        for token in tokenize(text):
+            weights[token] += weight
+    return weights
+
+def index_post(post):
+    """重建单个帖子的索引，在帖子创建、修改后调用；失效的帖子只删除索引"""
+    SearchToken.objects.filter(post=post).delete()
+    if not post.is_active:
+        return
+    SearchToken.objects.bulk_create([
+        SearchToken(token=token, post=post, weight=weight)
+        for token, weight in post_tokens(post).items()
+    ])
+
+def index_theme(theme):
+    """主题标题或描述修改后，重建其根帖子的索引"""
+    if theme.first_post_id:
+        post = Post.objects.select_related('theme').get(pk=theme.first_post_id)
+        index_post(post)
+
+def rebuild_index(batch_size=1000):
+    """清空并重建全部帖子的索引，返回索引的帖子数"""
+    SearchToken.objects.all().delete()
+    count = 0
+    batch = []
+    posts = Post.objects.filter(is_active=True).select_related('theme').order_by('pk')
+    for post in posts.iterator(chunk_size=batch_size):
+        batch.extend(
+            SearchToken(token=token, post=post, weight=weight)
+            for token, weight in post_tokens(post).items()
+        )
+        count += 1
+        if len(batch) >= batch_size:
+            SearchToken.objects.bulk_create(batch)
+            batch = []
+    SearchToken.objects.bulk_create(batch)
+    return count
+
+def search(query):
+    """按查询词检索帖子
+
+    返回按相关度排序的 {'post': id, 'matched': 命中词元数, 'score': 权重和} 查询集。
+    至少命中一半查询词元的帖子才会返回，命中词元多的排在前面，其次按权重和、发布时间排序。
+    只有一个汉字的查询词同时匹配以该字开头的两字词元。
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return SearchToken.objects.none()
+    condition = Q(token__in=tokens)
+    for token in tokens:
+        if len(token) == 1 and CJK_RE.match(token):
+            condition |= Q(token__startswith=token)
+    min_matched = (len(tokens) + 1) // 2
+    return (
+        SearchToken.objects.filter(condition, post__is_active=True)
+        .values('post')
+        .annotate(matched=Count('token', distinct=True), score=Sum('weight'))
+        .filter(matched__gte=min_matched)
+        .order_by('-matched', '-score', '-post__created_at', '-post')
+    )
@@ -1,23 +1,169 @@
 from rest_framework import serializers
 from .models import Post, PostImage, Theme
 from users.serializers import UserSerializer
-from django.core.files.uploadedfile import InMemoryUploadedFile
 from rest_framework.response import Response
+from django.db import transaction
+from django.db.models import Q
 from collections import defaultdict
+from . import counters
+from . import cache
+from . import search
+from . import events
+from . import tree
+from .images import enqueue_variants
+from hetaoshu.metrics import serializer_timing
 
-class PostReplySerializer(serializers.ModelSerializer):
-    """帖子回复序列化器，用于嵌套展示回复"""
-    author = UserSerializer(read_only=True)
-    images = serializers.SerializerMethodField()
-    def get_images(self, obj):
-        return PostImageSerializer(obj.images,many=True).data
-    class Meta:
-        model = Post
-        fields = ['id', 'content', 'author', 'updated_at','images']
-        read_only_fields = fields
+class UpdateFieldsMixin:
+    """更新时只保存提交的字段，避免用内存中的旧值覆盖并发更新的计数字段"""
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
+
+class TimedSerializerMixin:
+    """serializer.data的耗时计入当前请求的序列化耗时（见hetaoshu.metrics.serializer_timing）"""
+    @property
+    def data(self):
+        with serializer_timing():
+            return super().data
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """many=True时使用，在Meta.list_serializer_class中指定"""
+
+def parse_field_list(request, name):
+    """解析逗号分隔的查询参数（如fields、expand），参数不存在时返回None"""
+    if request is None or name not in request.query_params:
+        return None
+    return {item.strip() for item in request.query_params[name].split(',') if item.strip()}
+
+class SparseFieldsMixin:
+    """按查询参数裁剪输出字段，只作用于只读的序列化（没有传入data时）
+
+    fields=a,b  只返回列出的字段
+    expand=x,y  展开collapsed_fields中的嵌套对象
+    列表接口（context中list为True）默认只返回list_fields中的字段，
+    collapsed_fields中的嵌套对象默认只返回ID；详情接口默认返回全部字段并展开嵌套对象。
+    """
+    list_fields = None
+    collapsed_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'data' in kwargs:
+            return
+        request = self._context.get('request')
+        is_list = self._context.get('list', False)
+        fields = parse_field_list(request, 'fields')
+        if fields is None and is_list and self.list_fields is not None:
+            fields = set(self.list_fields)
+        if fields is not None:
+            for name in list(self.fields):
+                if name not in fields:
+                    self.fields.pop(name)
+        if is_list:
+            expand = parse_field_list(request, 'expand') or set()
+            for name in self.collapsed_fields:
+                if name in self.fields and name not in expand:
+                    self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+def reply_tree_posts(theme):
+    """主题下的有效帖子，加上根帖子（根帖子即使失效也要返回）
+
+    根帖子属于同一主题，条件写在theme_id之下，查询只扫描该主题在post_theme_idx上的范围
+    """
+    return Post.objects.filter(Q(is_active=True) | Q(pk=theme.first_post_id), theme_id=theme.pk).select_related('author')
+
+def reply_tree_images(theme):
+    """主题下全部帖子的图片"""
+    return PostImage.objects.filter(post__theme_id=theme.pk)
+
+def _load_reply_tree(theme):
+    """取出回复树所需的帖子、作者和图片，共两次查询；每个作者、每张图片只序列化一次"""
+    posts = list(reply_tree_posts(theme))
+    images = list(reply_tree_images(theme))
+    authors = {}
+    for post in posts:
+        authors.setdefault(post.author_id, post.author)
+    author_data = dict(zip(authors, UserSerializer(list(authors.values()), many=True).data))
+    image_data = dict(zip((image.id for image in images), PostImageSerializer(images, many=True).data))
+    images_by_post = defaultdict(list)
+    for image in images:
+        images_by_post[image.post_id].append(image.id)
+    return posts, author_data, image_data, images_by_post
+
+def build_reply_tree(theme):
+    """构建主题的回复树
+
+    帖子连同作者、全部图片共两次查询取出，之后在内存中非递归地组装，
+    返回普通dict，避免为每个节点创建序列化器和懒加载作者、图片。
+    """
+    root_id = theme.first_post_id
+    if root_id is None:
+        return None
+    posts, author_data, image_data, images_by_post = _load_reply_tree(theme)
+    datetime_field = serializers.DateTimeField()
+    nodes = {}
+    for post in posts:
+        nodes[post.id] = {
+            'id': str(post.id),
+            'content': post.content,
+            'author': author_data[post.author_id],
+            'updated_at': datetime_field.to_representation(post.updated_at),
+            'images': [image_data[image_id] for image_id in images_by_post.get(post.id, [])],
+            'replies': [],
+        }
+    # 按帖子原有顺序挂到父节点下，父帖子已失效的回复不会出现在树中
+    for post in posts:
+        if post.id != root_id and post.parent_id in nodes:
+            nodes[post.parent_id]['replies'].append(nodes[post.id])
+    return nodes.get(root_id)
+
+def build_flat_reply_tree(theme):
+    """构建扁平格式的回复树
 
-class ThemeReplyTreeSerializer(serializers.ModelSerializer):
-    """简化的主题回复树序列化器"""
+    nodes为按树的先序排列的节点列表，节点用parent引用父节点ID，author和images只保存ID；
+    users、images为以ID为键的作者和图片表，每个作者、每张图片只出现一次，
+    响应大小随参与者数量而不是回复数量增长。
+    """
+    root_id = theme.first_post_id
+    if root_id is None:
+        return None
+    posts, author_data, image_data, images_by_post = _load_reply_tree(theme)
+    children = defaultdict(list)
+    for post in posts:
+        if post.id != root_id:
+            children[post.parent_id].append(post)
+    root = next((post for post in posts if post.id == root_id), None)
+    if root is None:
+        return None
+    datetime_field = serializers.DateTimeField()
+    nodes, user_ids, image_ids = [], set(), []
+    # 非递归的先序遍历，父帖子已失效的回复不可达，不会出现在结果中
+    stack = [root]
+    while stack:
+        post = stack.pop()
+        post_images = images_by_post.get(post.id, [])
+        nodes.append({
+            'id': str(post.id),
+            'parent': str(post.parent_id) if post.parent_id else None,
+            'content': post.content,
+            'author': post.author_id,
+            'updated_at': datetime_field.to_representation(post.updated_at),
+            'images': [str(image_id) for image_id in post_images],
+        })
+        user_ids.add(post.author_id)
+        image_ids.extend(post_images)
+        stack.extend(reversed(children.get(post.id, [])))
+    return {
+        'root': str(root_id),
+        'nodes': nodes,
+        'users': {str(user_id): author_data[user_id] for user_id in user_ids},
+        'images': {str(image_id): image_data[image_id] for image_id in image_ids},
+    }
+
+class ThemeReplyTreeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """简化的主题回复树序列化器，context中layout为flat时返回扁平格式（见build_flat_reply_tree）"""
     author = UserSerializer(read_only=True)
     reply_tree = serializers.SerializerMethodField()
     class Meta:
@@ -26,43 +172,32 @@ class ThemeReplyTreeSerializer(serializers.ModelSerializer):
         read_only_fields = fields
     def get_reply_tree(self, obj):
         """获取主题下的所有帖子，在内存中构建回复树"""
-        # 一次性获取该主题下的所有有效帖子
-        all_posts = list(obj.posts.filter(is_active=True))
-        # 创建帖子ID到帖子对象的映射
-        post_id_map = {post.id: post for post in all_posts}
-        # 创建父帖子ID到子帖子列表的映射
-        parent_child_map = defaultdict(list)
-        for post in all_posts:
-            if post.parent_id and post.parent_id in post_id_map:
-                parent_child_map[post.parent_id].append(post)
-        # 递归构建回复树结构
-        def build_reply_tree(post):
-            post_data = PostReplySerializer(post).data
-            post_data['replies'] = [build_reply_tree(child) for child in parent_child_map.get(post.id, [])]
-            return post_data
-        # 从根帖子开始构建回复树
-        result=build_reply_tree(obj.first_post)
-        return result
+        if self.context.get('layout') == 'flat':
+            return build_flat_reply_tree(obj)
+        return build_reply_tree(obj)
     
-class ThemeSerializer(serializers.ModelSerializer):
+class ThemeSerializer(TimedSerializerMixin, SparseFieldsMixin, UpdateFieldsMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
-    post_count = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
     post = serializers.SerializerMethodField()
+    # 列表卡片用到的字段，描述和有效期只在详情中返回
+    list_fields = ('id', 'title', 'theme_type', 'author', 'created_at', 'post_count', 'post', 'image')
     class Meta:
         model = Theme
         fields = ('id', 'title', 'theme_type', 'description','valid_until','author', 'created_at', 'updated_at', 'post_count','post','image')
         read_only_fields = ('id', 'author', 'created_at', 'updated_at', 'post_count')
+        list_serializer_class = TimedListSerializer
     
-    def get_post_count(self, obj):
-        return obj.posts.count()
     def get_post(self, obj):
         if obj.first_post:
             return PostCardSerializer(obj.first_post).data
         return None
     def get_image(self, obj):
-        if obj.first_post and obj.first_post.images.exists():
-            return PostImageSerializer(obj.first_post.images.first()).data
+        if obj.first_post:
+            # 使用all()以便命中预取的图片缓存
+            first_image = next(iter(obj.first_post.images.all()), None)
+            if first_image:
+                return PostImageSerializer(first_image).data
         return None
     def create(self, validated_data):
         request = self.context.get('request')
@@ -78,59 +213,111 @@ class ThemeSerializer(serializers.ModelSerializer):
             # 设置作者为当前登录用户, 主题帖为刚刚创建的主题帖
             post=serializer.save(author=request.user, theme=theme)
         theme.first_post = post
-        theme.save()
+        # post_count已由计数逻辑更新，这里只保存first_post
+        theme.save(update_fields=['first_post', 'updated_at'])
+        cache.bump_theme_version(theme.pk)
         return theme
 
 class PostImageSerializer(serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField()
     class Meta:
         model = PostImage
-        fields = ('id', 'image', 'created_at', 'order')
-        read_only_fields = ('id', 'created_at')
+        fields = ('id', 'image', 'created_at', 'order', 'width', 'height', 'variants')
+        read_only_fields = ('id', 'created_at', 'width', 'height', 'variants')
+        list_serializer_class = TimedListSerializer
+    def get_variants(self, obj):
+        """返回各变体的访问地址和尺寸，变体尚未生成时为空，客户端使用原图"""
+        storage = obj.image.storage
+        request = self.context.get('request')
+        variants = {}
+        for name, formats in obj.variants.items():
+            variants[name] = {}
+            for fmt, info in formats.items():
+                url = storage.url(info['path'])
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                variants[name][fmt] = {'url': url, 'width': info['width'], 'height': info['height']}
+        return variants
+class ThemeBriefSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Theme
+        fields = ('id', 'title')
+        read_only_fields = fields
+class MessageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """消息（收到的回复）序列化器，只包含消息列表展示所需的字段"""
+    author = UserSerializer(read_only=True)
+    theme = ThemeBriefSerializer(read_only=True)
+    parent_content = serializers.CharField(source='parent.content', read_only=True, default=None)
+    class Meta:
+        model = Post
+        fields = ('id', 'content', 'author', 'created_at', 'theme', 'parent', 'parent_content')
+        read_only_fields = fields
+        list_serializer_class = TimedListSerializer
+class SearchResultSerializer(serializers.ModelSerializer):
+    """搜索结果序列化器，score为命中词元的权重和"""
+    author = UserSerializer(read_only=True)
+    theme = ThemeBriefSerializer(read_only=True)
+    score = serializers.IntegerField(read_only=True)
+    class Meta:
+        model = Post
+        fields = ('id', 'title', 'content', 'author', 'created_at', 'theme', 'parent', 'score')
+        read_only_fields = fields
+        list_serializer_class = TimedListSerializer
 class PostCardSerializer(serializers.ModelSerializer):
-    image_count = serializers.SerializerMethodField()
     class Meta:
         model = Post
         fields = ('id', 'title', 'content', 'author', 'created_at', 'updated_at','image_count')
         read_only_fields = fields
-    def get_image_count(self, obj):
-        return obj.images.count()
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(TimedSerializerMixin, SparseFieldsMixin, UpdateFieldsMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     theme = ThemeSerializer(read_only=True)
-    image_count = serializers.SerializerMethodField()
-    comment_count = serializers.SerializerMethodField()
+    comment_count = serializers.IntegerField(source='reply_count', read_only=True)
     first_image = serializers.SerializerMethodField()  # 新增：返回第一张图片
     parent_content = serializers.SerializerMethodField()
+    # 列表中的帖子通常属于同一主题、同一父帖子，默认不重复返回主题详情和父帖子内容
+    list_fields = ('id', 'title', 'content', 'author', 'created_at', 'updated_at', 'image_count', 'comment_count', 'first_image', 'theme', 'parent')
+    collapsed_fields = ('theme',)
     class Meta:
         model = Post
         fields = ('id', 'title', 'content', 'author', 'created_at', 'updated_at', 'image_count', 'comment_count', 'first_image', 'theme','parent','parent_content')
         read_only_fields = ('id', 'author', 'created_at', 'updated_at', 'image_count', 'comment_count', 'first_image') 
+        list_serializer_class = TimedListSerializer
+    def validate_parent(self, value):
+        # 修改父帖子时不能移动到自己或自己的回复下，否则帖子树中会出现环
+        if self.instance is not None and value is not None and tree.is_descendant(value.pk, self.instance.pk):
+            raise serializers.ValidationError('不能把帖子移动到自己或自己的回复下')
+        return value
+
     def get_parent_content(self, obj):
         if obj.parent:
             return obj.parent.content
         return None
-    def get_image_count(self, obj):
-        return obj.images.count()
-    
-    def get_comment_count(self, obj):
-        return obj.replies.filter(is_active=True).count()
-    
     def get_first_image(self, obj):
-        # 获取帖子的第一张图片
-        first_image = obj.images.order_by('order').first()
+        # 获取帖子的第一张图片，使用all()以便命中预取的图片缓存（图片默认按order排序）
+        first_image = next(iter(obj.images.all()), None)
         if first_image:
             # 使用PostImageSerializer序列化第一张图片
             return PostImageSerializer(first_image).data
         return None
         
+    @transaction.atomic
     def create(self, validated_data):
         # 创建帖子
         post = Post.objects.create(**validated_data)
+        counters.post_created(post)
+        tree.post_created(post)
+        search.index_post(post)
+        # 回复通知：事件内容与消息列表中的一项相同
+        if post.parent_id:
+            events.reply_created(post, MessageSerializer(post, context={'list': True}).data)
         # 处理图片上传
         request = self.context.get('request')
         if request and 'images[]' in request.FILES:
-            # 如果是单个文件
-            if isinstance(request.FILES.get('images[]'), InMemoryUploadedFile):
-                for (order,image) in enumerate(request.FILES.getlist('images[]')):
-                    PostImage.objects.create(post=post, image=image,order=order)        
+            # 上传文件已由上传处理器写入临时文件
+            images = request.FILES.getlist('images[]')
+            for (order,image) in enumerate(images):
+                post_image = PostImage.objects.create(post=post, image=image,order=order)
+                enqueue_variants(post_image)
+            counters.images_added(post.pk, len(images))
+            post.image_count += len(images)
         return post
\ No newline at end of file
@@ -0,0 +1,213 @@
+import io
+import shutil
+import tempfile
+from unittest import skipUnless
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import URLResolver, get_resolver, resolve
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+from users.authentication import local_tokens
+from users.models import User
+from posts.models import Post, PostImage, Theme
+from posts.query_plans import MIN_ROWS, hot_queries, plan_problems
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='hetaoshu-test-media-')
+# 测试使用进程内缓存，不清空部署环境的共享缓存
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+def png_file(name='test.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'white').save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+def view_key(view_func, method):
+    """视图在查询预算中的标识：(视图名, action)，函数视图和APIView的action为None"""
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{view_func.__module__}.{view_func.__name__}', actions.get(method.lower())
+
+def declared_budgets(patterns=None):
+    """URL配置中声明了查询预算的全部(视图名, action)"""
+    keys = set()
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            keys |= declared_budgets(pattern.url_patterns)
+            continue
+        view_func = pattern.callback
+        view_class = getattr(view_func, 'cls', None)
+        actions = getattr(view_func, 'actions', None)
+        if actions:
+            budgets = getattr(view_class, 'query_budgets', None) or {}
+            keys.update(view_key(view_func, method) for method, action in actions.items() if action in budgets)
+        elif getattr(view_func, 'query_budget', None) is not None or getattr(view_class, 'query_budget', None) is not None:
+            keys.add(view_key(view_func, 'get'))
+    return keys
+
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=MEDIA_ROOT)
+class ForumTestCase(APITestCase):
+    """通过接口创建两个用户、一个主题、三层回复和一张图片"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('20240001', 'author@example.com', 'password', name='作者')
+        cls.replier = User.objects.create_user('20240002', 'replier@example.com', 'password', name='回复者')
+        cls.author_token = Token.objects.create(user=cls.author)
+        cls.replier_token = Token.objects.create(user=cls.replier)
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + cls.author_token.key)
+        response = client.post('/api/themes/', {'title': '核桃树下', 'theme_type': 'share', 'content': '第一个帖子'})
+        assert response.status_code == 201, response.content
+        cls.theme = Theme.objects.get(pk=response.data['id'])
+        cls.root = cls.theme.first_post
+
+        client.credentials(HTTP_AUTHORIZATION='Token ' + cls.replier_token.key)
+        parent = cls.root
+        for depth in range(3):
+            response = client.post('/api/posts/', {'parent': str(parent.pk), 'content': f'第{depth + 1}层回复'})
+            assert response.status_code == 201, response.content
+            parent = Post.objects.get(pk=response.data['id'])
+        cls.deepest = parent
+        cls.image = PostImage.objects.create(post=cls.root, image=png_file(), order=0)
+
+    def setUp(self):
+        cache.clear()
+        local_tokens.entries.clear()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.author_token.key)
+
+class QueryBudgetTests(ForumTestCase):
+    """以REQUEST_METRICS_STRICT请求每个声明了查询预算的接口，超出预算时中间件抛出QueryBudgetExceeded"""
+
+    def requests(self):
+        theme, root, deepest = self.theme.pk, self.root.pk, self.deepest.pk
+        return [
+            ('get', '/api/themes/'),
+            ('get', '/api/themes/?page=1'),
+            ('get', f'/api/themes/{theme}/'),
+            ('get', f'/api/themes/{theme}/reply_tree/'),
+            ('get', f'/api/themes/{theme}/reply_tree/?layout=flat'),
+            ('get', '/api/images/'),
+            ('get', f'/api/images/{self.image.pk}/'),
+            ('get', '/api/posts/'),
+            ('get', '/api/posts/?page=1'),
+            ('get', '/api/posts/?expand=theme'),
+            ('get', f'/api/posts/{root}/'),
+            ('get', f'/api/posts/{root}/comments/'),
+            ('get', f'/api/posts/{root}/images/'),
+            ('get', f'/api/posts/{root}/subtree/'),
+            ('get', f'/api/posts/{deepest}/ancestors/'),
+            ('get', '/api/messages/'),
+            ('get', '/api/messages/?page=1'),
+            ('get', '/api/messages/?unread_count=1'),
+            ('get', '/api/search/?q=核桃'),
+            ('post', '/api/events/ticket/'),
+            ('get', f'/api/users/{self.author.pk}/posts/'),
+            ('get', f'/api/users/{self.author.pk}/posts/?page=1'),
+        ]
+
+    @override_settings(REQUEST_METRICS_ENABLED=True, REQUEST_METRICS_STRICT=True)
+    def test_cold_requests_within_budget(self):
+        covered = set()
+        for method, path in self.requests():
+            with self.subTest(method=method, path=path):
+                # 每个请求前清空缓存，按令牌、回复树、版本号都未命中的最坏情况计数
+                cache.clear()
+                local_tokens.entries.clear()
+                response = getattr(self.client, method)(path)
+                self.assertLess(response.status_code, 400, response.content)
+                covered.add(view_key(resolve(path.split('?')[0]).func, method))
+        self.assertEqual(declared_budgets() - covered, set(), '以上接口声明了查询预算，但没有在测试中请求')
+
+    def test_server_timing_disabled_by_default(self):
+        with override_settings(REQUEST_METRICS_ENABLED=False):
+            response = self.client.get('/api/themes/')
+        self.assertNotIn('Server-Timing', response)
+        with override_settings(REQUEST_METRICS_ENABLED=True):
+            response = self.client.get('/api/themes/')
+        self.assertIn('db-connect', response['Server-Timing'])
+
+    @override_settings(REQUEST_METRICS_ENABLED=True)
+    def test_serializer_timed_separately(self):
+        with self.assertLogs('hetaoshu.metrics') as logs:
+            response = self.client.get('/api/themes/')
+        self.assertRegex(response['Server-Timing'], r'serializer;dur=[\d.]+')
+        self.assertIn('"serializer_ms": ', logs.output[0])
+
+class ThemeFeedQueryTests(ForumTestCase):
+    """主题信息流的查询数不随每页数量增加"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        client = APIClient()
+        client.force_authenticate(cls.author)
+        for i in range(60):
+            response = client.post('/api/themes/', {'title': f'主题{i}', 'theme_type': 'share', 'content': f'内容{i}'})
+            assert response.status_code == 201, response.content
+            PostImage.objects.create(post_id=response.data['post']['id'], image=png_file(), order=0)
+
+    def test_query_count_constant(self):
+        self.client.force_authenticate(self.author)
+        for page_size in (1, 10, 60):
+            with self.subTest(page_size=page_size):
+                # 主题（含作者、第一个帖子及其作者）一次，第一个帖子的图片预取一次
+                with self.assertNumQueries(2):
+                    response = self.client.get('/api/themes/', {'page_size': page_size})
+                self.assertEqual(len(response.data['results']), page_size)
+                self.assertTrue(all(theme['image'] for theme in response.data['results']))
+
+class UploadLimitTests(ForumTestCase):
+    """上传内容超过大小限制时返回413和JSON格式的错误信息，不创建主题"""
+
+    def post_theme(self, *images):
+        return self.client.post('/api/themes/', {
+            'title': '超限', 'theme_type': 'share', 'content': '超限', 'images[]': list(images),
+        }, format='multipart')
+
+    @override_settings(UPLOAD_MAX_FILE_SIZE=2048)
+    def test_file_too_large(self):
+        response = self.post_theme(SimpleUploadedFile('big.png', b'0' * 4096, content_type='image/png'))
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('detail', response.json())
+        self.assertFalse(Theme.objects.filter(title='超限').exists())
+
+    @override_settings(UPLOAD_MAX_REQUEST_SIZE=6144)
+    def test_request_too_large(self):
+        files = [SimpleUploadedFile(f'{i}.png', b'0' * 2048, content_type='image/png') for i in range(4)]
+        response = self.post_theme(*files)
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('detail', response.json())
+        self.assertFalse(Theme.objects.filter(title='超限').exists())
+
+@skipUnless(connection.vendor == 'mysql', 'SQLite的执行计划与MySQL差别较大，只在MySQL上检查')
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryPlanTests(TestCase):
+    """信息流、回复树、图片和验证码等热点查询在MIN_ROWS规模的数据上不全表扫描、不额外排序"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        # 每个用户1~3条验证码，约30%的帖子带1~3张图片，各表的行数都不少于MIN_ROWS
+        call_command('seed_benchmark_data', users=MIN_ROWS, themes=MIN_ROWS, posts=MIN_ROWS * 5,
+                     skip_search_index=True, stdout=io.StringIO())
+
+    def test_no_full_scan_or_filesort(self):
+        checks = hot_queries()
+        self.assertIsNotNone(checks)
+        for name, queryset, allow_filesort in checks:
+            with self.subTest(name):
+                self.assertEqual(plan_problems(queryset, allow_filesort), [], str(queryset.query))
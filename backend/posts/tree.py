@@ -0,0 +1,85 @@
+from collections import defaultdict
+from itertools import groupby
+from .models import Post, PostClosure
+
+# 帖子树的闭包表（PostClosure）由这里维护：
+# 帖子创建时写入它与自己（depth为0）以及与父帖子每个祖先的关系，共“深度+1”行；
+# 子树、限定深度的后代和祖先链都在(ancestor, depth)或(descendant, depth)索引上一次范围查询取出，无需递归。
+# 批量写入帖子（bulk_create）不会经过这里，写入后需执行 manage.py rebuild_post_tree。
+
+def post_created(post):
+    """新帖子创建后写入它在闭包表中的行"""
+    links = [PostClosure(ancestor_id=post.pk, descendant_id=post.pk, depth=0)]
+    if post.parent_id:
+        links.extend(
+            PostClosure(ancestor_id=ancestor_id, descendant_id=post.pk, depth=depth + 1)
+            for ancestor_id, depth in PostClosure.objects.filter(descendant_id=post.parent_id).values_list('ancestor_id', 'depth')
+        )
+    PostClosure.objects.bulk_create(links)
+
+def post_moved(post):
+    """帖子的父帖子改变后，把它的整棵子树挂到新的父帖子下"""
+    subtree = list(PostClosure.objects.filter(ancestor_id=post.pk).values_list('descendant_id', 'depth'))
+    subtree_ids = [descendant_id for descendant_id, _ in subtree]
+    # 删除子树与原来各祖先之间的关系，子树内部的关系不变；
+    # 先取出ID列表，MySQL不支持在DELETE的子查询中引用同一张表
+    PostClosure.objects.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+    if post.parent_id:
+        ancestors = PostClosure.objects.filter(descendant_id=post.parent_id).values_list('ancestor_id', 'depth')
+        PostClosure.objects.bulk_create([
+            PostClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=ancestor_depth + depth + 1)
+            for ancestor_id, ancestor_depth in ancestors
+            for descendant_id, depth in subtree
+        ])
+
+def is_descendant(post_id, ancestor_id):
+    """post_id是否为ancestor_id自身或其后代，用于防止把帖子移动到自己的子树下"""
+    return PostClosure.objects.filter(ancestor_id=ancestor_id, descendant_id=post_id).exists()
+
+def descendants(post, depth=None):
+    """post的全部后代（不含自身）；depth不为空时只取相差不超过depth层的后代"""
+    links = {'ancestor_links__ancestor_id': post.pk, 'ancestor_links__depth__gt': 0}
+    if depth is not None:
+        links['ancestor_links__depth__lte'] = depth
+    # 条件写在同一个filter中，作用于闭包表的同一行
+    return Post.objects.filter(**links)
+
+def ancestors(post):
+    """post的祖先链（不含自身），从根帖子开始"""
+    return Post.objects.filter(
+        descendant_links__descendant_id=post.pk, descendant_links__depth__gt=0
+    ).order_by('-descendant_links__depth')
+
+def thread_links(posts):
+    """一个主题的帖子[(id, parent_id)]在闭包表中的全部行"""
+    ids = {pk for pk, _ in posts}
+    children = defaultdict(list)
+    for pk, parent_id in posts:
+        # 父帖子不在本主题中时按根帖子处理
+        children[parent_id if parent_id in ids else None].append(pk)
+    # 非递归的深度优先遍历，chain为从根帖子到当前帖子的路径
+    stack = [(pk, ()) for pk in children[None]]
+    while stack:
+        pk, chain = stack.pop()
+        chain += (pk,)
+        for depth, ancestor_id in enumerate(reversed(chain)):
+            yield PostClosure(ancestor_id=ancestor_id, descendant_id=pk, depth=depth)
+        stack.extend((child, chain) for child in children.get(pk, ()))
+
+def rebuild_tree(batch_size=1000):
+    """清空并根据Post.parent重建闭包表，返回帖子数"""
+    PostClosure.objects.all().delete()
+    count = 0
+    batch = []
+    # 回复与父帖子属于同一主题，逐个主题在内存中组装
+    posts = Post.objects.order_by('theme_id').values_list('theme_id', 'pk', 'parent_id')
+    for _, thread in groupby(posts.iterator(chunk_size=batch_size), key=lambda row: row[0]):
+        thread = [(pk, parent_id) for _, pk, parent_id in thread]
+        count += len(thread)
+        for link in thread_links(thread):
+            batch.append(link)
+            if len(batch) >= batch_size:
+                PostClosure.objects.bulk_create(batch)
+                batch = []
+    PostClosure.objects.bulk_create(batch)
+    return count
@@ -1,6 +1,7 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PostViewSet,PostImageViewSet,ThemeViewSet
+from .views import PostViewSet,PostImageViewSet,ThemeViewSet,SearchView,EventTicketView
 
 # 创建路由器并注册视图集
 router = DefaultRouter()
@@ -10,7 +11,21 @@ router.register(r'images', PostImageViewSet, basename='image')
 
 urlpatterns = [path('', include(router.urls)),
     path('posts/<uuid:pk>/comments/', PostViewSet.as_view({'get': 'get_comment'}), name='post-comments'),
+    path('posts/<uuid:pk>/subtree/', PostViewSet.as_view({'get': 'get_subtree'}), name='post-subtree'),
+    path('posts/<uuid:pk>/ancestors/', PostViewSet.as_view({'get': 'get_ancestors'}), name='post-ancestors'),
     path('posts/<uuid:pk>/images/', PostViewSet.as_view({'get': 'get_images'}), name='post-images'),
     path('themes/<uuid:pk>/reply_tree/', ThemeViewSet.as_view({'get': 'get_reply_tree'}), name='theme-reply-tree'),
     path('messages/', PostViewSet.as_view({'get': 'get_messages'}), name='post-messages'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('events/ticket/', EventTicketView.as_view(), name='event-ticket'),
 ]
+
+if settings.ASYNC_VIEWS:
+    # ASGI部署时，热点读接口的GET请求由异步视图处理，需排在路由器生成的同名URL之前
+    from . import async_views
+    urlpatterns = [
+        path('themes/', async_views.theme_list, name='theme-list'),
+        path('themes/<uuid:pk>/reply_tree/', async_views.reply_tree, name='theme-reply-tree'),
+        path('posts/<uuid:pk>/', async_views.post_detail, name='post-detail'),
+        path('messages/', async_views.messages, name='post-messages'),
+    ] + urlpatterns
@@ -2,21 +2,56 @@ from rest_framework import viewsets, permissions, status, filters,status,excepti
 from rest_framework.response import Response
 from rest_framework import status, viewsets, permissions, filters
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.db import transaction
 from users.models import User
+from users.authentication import update_cached_token
 from .models import Post, PostImage, Theme
 from .serializers import (
-    PostSerializer, PostImageSerializer, ThemeSerializer,ThemeReplyTreeSerializer
+    PostSerializer, PostImageSerializer, ThemeSerializer,ThemeReplyTreeSerializer, MessageSerializer,
+    SearchResultSerializer, parse_field_list
 )
 from .permissions import IsAuthorOrReadOnly, CanDeleteComment
+from .pagination import FeedPagination, SearchPagination
+from . import counters
+from . import cache
+from . import search
+from . import tree
+from .conditional import make_etag, not_modified, set_etag
+from .images import enqueue_variants
+from .events import issue_ticket
+
+def message_window_start(user):
+    """消息的起始时间：上次登录时间，从未登录时为5天前"""
+    return user.last_login or timezone.now() - timezone.timedelta(days=5)
+
+def touch_last_login(user, last_login):
+    """距上次记录超过10分钟时更新user.last_login（不保存），返回是否需要保存"""
+    now = timezone.now()
+    if now - last_login > timezone.timedelta(seconds=600):
+        user.last_login = now
+        return True
+    return False
 
 class ThemeViewSet(viewsets.ModelViewSet):
     queryset = Theme.objects.filter(is_active=True)
     serializer_class = ThemeSerializer
     permission_classes = [IsAuthenticated]
+    # 每个请求的查询数上限（含认证查询），页码分页多一次COUNT
+    query_budgets = {'list': 4, 'retrieve': 3, 'get_reply_tree': 4}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve']:
+            queryset = queryset.for_feed()
+        elif self.action == 'get_reply_tree':
+            queryset = queryset.select_related('author')
+        return queryset
+
     def create(self, request):
         """创建新主题的API入口"""
         # 验证数据
@@ -29,19 +64,47 @@ class ThemeViewSet(viewsets.ModelViewSet):
         serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def retrieve(self, request, *args, **kwargs):
+        """获取主题详情，客户端版本未变化时返回304"""
+        theme = self.get_object()
+        etag = make_etag('theme', theme.pk, theme.updated_at, cache.get_theme_version(theme.pk))
+        response = not_modified(request, etag)
+        if response is None:
+            response = Response(ThemeSerializer(theme, context={'request': request}).data)
+        return set_etag(response, etag)
+
+    reply_tree_layouts = ('nested', 'flat')
+
     def get_reply_tree(self, request, pk):
-        """获取主题的评论树"""
+        """获取主题的评论树，按主题版本号缓存，客户端版本未变化时返回304
+
+        查询参数：layout=nested 嵌套格式（默认）；layout=flat 扁平节点列表加作者、图片表
+        """
+        layout = request.query_params.get('layout', 'nested')
+        if layout not in self.reply_tree_layouts:
+            raise exceptions.ValidationError({'layout': f'可选值为{", ".join(self.reply_tree_layouts)}'})
         theme = self.get_object()
-        serializer = ThemeReplyTreeSerializer(theme)
-        return Response(serializer.data)
+        etag = make_etag('reply_tree', layout, theme.pk, cache.get_theme_version(theme.pk))
+        response = not_modified(request, etag)
+        if response is None:
+            data = cache.get_reply_tree(theme, lambda: ThemeReplyTreeSerializer(theme, context={'layout': layout}).data, layout)
+            response = Response(data)
+        return set_etag(response, etag)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        theme = serializer.save()
+        # 主题标题和描述索引在根帖子上
+        search.index_theme(theme)
+        cache.bump_theme_version(theme.pk)
 
     def list(self, request):
         """获取所有活跃帖子（重写父类的list方法）"""
-        themes = Theme.objects.filter(is_active=True).order_by('-created_at')
+        themes = Theme.objects.filter(is_active=True).for_feed().order_by('-created_at')
         # 应用分页
-        paginator = PostPagination()
+        paginator = FeedPagination()
         paginated_posts = paginator.paginate_queryset(themes, request)
-        serializer = ThemeSerializer(paginated_posts, many=True)
+        serializer = ThemeSerializer(paginated_posts, many=True, context={'request': request, 'list': True})
         # 返回分页后的响应，包含results和next字段
         return paginator.get_paginated_response(serializer.data)
 
@@ -49,20 +112,35 @@ class PostImageViewSet(viewsets.ModelViewSet):
     queryset = PostImage.objects.all()
     serializer_class = PostImageSerializer
     permission_classes = [IsAuthenticated]
+    query_budgets = {'list': 3, 'retrieve': 2}
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        image = serializer.save()
+        enqueue_variants(image)
+        counters.images_added(image.post_id, 1)
+        cache.bump_theme_version(image.post.theme_id)
 
-# 自定义分页类
-class PostPagination(PageNumberPagination):
-    page_size = 24  # 每页显示20条
-    page_size_query_param = 'page_size'
-    max_page_size = 60
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        counters.images_removed(instance.post_id, 1)
+        cache.bump_theme_version(instance.post.theme_id)
+        instance.delete()
 
 class PostViewSet(viewsets.ModelViewSet):
     queryset = Post.objects.filter(is_active=True)
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # 全文搜索使用独立的 /api/search/ 接口，不再在帖子列表上做LIKE查询
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['author']
-    search_fields = ['title', 'content']
     ordering_fields = ['created_at', 'updated_at']
-    pagination_class = PostPagination
+    pagination_class = FeedPagination
+    query_budgets = {'list': 5, 'retrieve': 4, 'get_comment': 5, 'get_images': 3, 'get_messages': 3, 'get_subtree': 5, 'get_ancestors': 5}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.for_detail()
+        return queryset
     
     def get_permissions(self):
         # 所有操作都需要登录
@@ -71,41 +149,53 @@ class PostViewSet(viewsets.ModelViewSet):
             return [permissions.IsAuthenticated(), IsAuthorOrReadOnly()]
         # 其他所有操作都需要登录
         return [permissions.IsAuthenticated()]
-    
+
+    def expand_theme(self, request):
+        """列表接口默认只返回主题ID，expand=theme时才需要取出主题详情"""
+        return 'theme' in (parse_field_list(request, 'expand') or ())
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # 删除会级联到子回复，先扣除相关计数
+        counters.post_deleted(instance)
+        cache.bump_theme_version(instance.theme_id)
+        instance.delete()
+
     def list(self, request):
         """获取所有活跃帖子（重写父类的list方法）"""
-        posts = Post.objects.filter(is_active=True,parent__isnull=True).order_by('-created_at')
+        posts = Post.objects.filter(is_active=True,parent__isnull=True).for_detail(theme=self.expand_theme(request)).order_by('-created_at')
         # 应用分页
-        paginator = PostPagination()
+        paginator = FeedPagination()
         paginated_posts = paginator.paginate_queryset(posts, request)
-        serializer = PostSerializer(paginated_posts, many=True)
+        serializer = PostSerializer(paginated_posts, many=True, context={'request': request, 'list': True})
         # 返回分页后的响应，包含results和next字段
         return paginator.get_paginated_response(serializer.data)
     def get_messages(self, request):
         """获取用户消息
         筛选条件：post的parent的author是当前用户，且创建时间在last_visit之后
+        查询参数：
+            unread_count=1  只返回未读数量，供前端轮询，不更新last_login
+            cursor/page_size/page  分页返回；都不带时返回完整列表，兼容旧版前端
         """
         user = request.user
-        last_login=user.last_login
-        # 设为5天前
-        if not last_login:
-            last_login = timezone.datetime.now(timezone.utc) - timezone.timedelta(days=5)
-        now = timezone.now()
-        if now-last_login > timezone.timedelta(seconds=600):
-            user.last_login = now
+        last_login = message_window_start(user)
+        messages = Post.objects.received_by(user, last_login)
+        if request.query_params.get('unread_count'):
+            return Response({'unread_count': messages.count()})
+
+        if touch_last_login(user, last_login):
             user.save(update_fields=['last_login'])
-        # 构建查询：筛选出满足条件的帖子
-        messages = Post.objects.filter(
-            parent__author=user,  # 父帖子的作者是当前用户
-            is_active=True        # 帖子是有效的
-        ).exclude(author=user)
-        messages = messages.filter(created_at__gt=last_login)
+            update_cached_token(request.auth)
         # 按创建时间降序排列
-        messages = messages.order_by('-created_at')
-        
-        # 序列化结果
-        serializer = PostSerializer(messages, many=True)
-        return Response(serializer.data)
+        messages = messages.select_related('author', 'theme', 'parent').order_by('-created_at')
+        paginator = FeedPagination()
+        if not any(param in request.query_params for param in (paginator.cursor_query_param, paginator.page_query_param, paginator.page_size_query_param)):
+            serializer = MessageSerializer(messages, many=True, context={'request': request, 'list': True})
+            return Response(serializer.data)
+        paginated_messages = paginator.paginate_queryset(messages, request)
+        serializer = MessageSerializer(paginated_messages, many=True, context={'request': request, 'list': True})
+        return paginator.get_paginated_response(serializer.data)
+
     def create(self, request):
         """创建新帖子的API入口"""
         # 使用序列化器验证和保存数据，将request对象传递给context
@@ -116,6 +206,7 @@ class PostViewSet(viewsets.ModelViewSet):
                 parent = get_object_or_404(Post, id=request.data['parent'])
             # 设置作者为当前登录用户
             serializer.save(author=request.user,theme=parent.theme,parent=parent)
+            cache.bump_theme_version(parent.theme_id)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -125,25 +216,41 @@ class PostViewSet(viewsets.ModelViewSet):
         instance = self.get_object()
         if not instance.is_active:
             return Response({'detail': '帖子不存在或已被删除'}, status=404)
-        serializer = PostSerializer(instance)
-        return Response(serializer.data)
+        # 主题版本号覆盖了回复数、图片和所属主题的变化
+        etag = make_etag('post', instance.pk, instance.updated_at, cache.get_theme_version(instance.theme_id))
+        response = not_modified(request, etag)
+        if response is None:
+            serializer = PostSerializer(instance, context={'request': request})
+            response = Response(serializer.data)
+        return set_etag(response, etag)
     
+    @transaction.atomic
     def update(self, request, *args, **kwargs):
         """更新帖子内容和批量更新图片：删除指定ID以外的图片，添加新图片"""
         post = self.get_object()
+        parent_id = post.parent_id
         serializer=PostSerializer(post,data=request.data,partial=True,context={'request':request})
         if serializer.is_valid():
             serializer.save()
+            if post.parent_id != parent_id:
+                counters.post_moved(post, parent_id)
+                tree.post_moved(post)
+            search.index_post(post)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         # 保留的图片ID列表
         keep_image_ids = request.data.getlist('keep_image_ids[]')
         # 删除不需要保留的图片
-        PostImage.objects.filter(post=post).exclude(id__in=keep_image_ids).delete()
+        _, deleted = PostImage.objects.filter(post=post).exclude(id__in=keep_image_ids).delete()
+        counters.images_removed(post.pk, deleted.get(PostImage._meta.label, 0))
         # 添加新图片
-        for image in request.FILES.getlist('images[]'):
-            PostImage.objects.create(post=post, image=image)
-        serializer.save()
+        images = request.FILES.getlist('images[]')
+        for image in images:
+            post_image = PostImage.objects.create(post=post, image=image)
+            enqueue_variants(post_image)
+        counters.images_added(post.pk, len(images))
+        post.refresh_from_db(fields=['image_count', 'reply_count'])
+        cache.bump_theme_version(post.theme_id)
         # 返回更新后的完整帖子数据
         updated_post = self.get_object()  # 重新获取以确保获取最新状态
         return Response(serializer.data)
@@ -152,8 +259,33 @@ class PostViewSet(viewsets.ModelViewSet):
         """获取帖子的评论"""
         post=self.get_object()
         #post = get_object_or_404(Post, id=post_id)
-        comments = post.replies.filter(is_active=True).order_by('-created_at')
-        serializer = PostSerializer(comments, many=True)
+        comments = post.replies.filter(is_active=True).for_detail(theme=self.expand_theme(request)).order_by('-created_at')
+        serializer = PostSerializer(comments, many=True, context={'request': request, 'list': True})
+        return Response(serializer.data)
+
+    def get_subtree(self, request, pk):
+        """获取帖子的全部后代回复（不限于直接回复），按发布时间倒序游标分页
+        查询参数：
+            depth=N  只返回N层以内的回复，depth=1与评论接口相同
+        每条回复带有parent，可据此在客户端组装成树
+        """
+        post = self.get_object()
+        depth = request.query_params.get('depth')
+        if depth is not None:
+            if not depth.isdigit() or int(depth) < 1:
+                raise exceptions.ValidationError({'depth': '必须是正整数'})
+            depth = int(depth)
+        replies = tree.descendants(post, depth).filter(is_active=True).for_detail(theme=self.expand_theme(request))
+        paginator = FeedPagination()
+        page = paginator.paginate_queryset(replies, request)
+        serializer = PostSerializer(page, many=True, context={'request': request, 'list': True})
+        return paginator.get_paginated_response(serializer.data)
+
+    def get_ancestors(self, request, pk):
+        """获取帖子的祖先链，从根帖子到直接父帖子"""
+        post = self.get_object()
+        ancestors = tree.ancestors(post).for_detail(theme=self.expand_theme(request))
+        serializer = PostSerializer(ancestors, many=True, context={'request': request, 'list': True})
         return Response(serializer.data)
 
     def get_images(self,request,pk):
@@ -163,3 +295,34 @@ class PostViewSet(viewsets.ModelViewSet):
         serializer = PostImageSerializer(images, many=True)
         return Response(serializer.data)
 
+
+class SearchView(APIView):
+    """全文搜索主题标题、描述和帖子内容，按相关度排序分页返回
+
+    查询参数：q 搜索词；page、page_size 页码分页
+    """
+    permission_classes = [IsAuthenticated]
+    query_budget = 3
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        paginator = SearchPagination()
+        ranked = paginator.paginate_queryset(search.search(query), request, view=self)
+        posts = Post.objects.select_related('author', 'theme').in_bulk([row['post'] for row in ranked])
+        results = []
+        for row in ranked:
+            post = posts.get(row['post'])
+            if post is not None:
+                post.score = row['score']
+                results.append(post)
+        serializer = SearchResultSerializer(results, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class EventTicketView(APIView):
+    """获取回复通知SSE连接（/api/events/）的一次性凭证，避免登录令牌出现在URL和访问日志中"""
+    permission_classes = [IsAuthenticated]
+    query_budget = 1
+
+    def post(self, request):
+        return Response({'ticket': issue_ticket(request.user.pk), 'expires_in': settings.EVENTS_TICKET_TIMEOUT})
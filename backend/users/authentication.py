@@ -0,0 +1,131 @@
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from hashlib import sha256
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+# 令牌认证结果（令牌及其用户）缓存在共享缓存中，每个进程再保留一份LRU，命中时不查询数据库。
+# 每个用户在共享缓存中有一个版本号，缓存的记录带有写入时的版本号，版本号不一致即视为未命中；
+# 用户信息变化时只需更换该用户的版本号，所有进程中该用户的记录随即失效，不影响其他用户。
+# 令牌删除时共享缓存中的记录替换为“已撤销”标记，并发的查询不会把它写回。
+# 需要多个进程共享的缓存后端（默认的文件缓存即可），LocMemCache只在单进程部署时可用。
+
+REVOKED = 'revoked'
+
+def _token_key(key):
+    # 缓存键中不保存令牌原文
+    return 'auth:token:' + sha256(key.encode()).hexdigest()
+
+def _generation_key(user_id):
+    return f'auth:user:{user_id}:generation'
+
+def get_user_generation(user_id):
+    """获取用户当前的版本号"""
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # 版本号丢失（过期、被淘汰）时生成新的版本号，使该用户已有的记录全部失效
+        cache.add(key, uuid.uuid4().hex, None)
+        generation = cache.get(key)
+    return generation
+
+def _bump_user_generation(user_id):
+    # 直接写入新的随机版本号，不依赖缓存后端的原子自增
+    cache.set(_generation_key(user_id), uuid.uuid4().hex, None)
+
+class LocalTokenCache:
+    """进程内的LRU缓存，保存序列化后的令牌，每次读取得到新的对象，避免请求之间共享同一个用户对象"""
+
+    def __init__(self, size, timeout):
+        self.size, self.timeout = size, timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """返回(版本号, 令牌)，未命中或已过期时返回None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            generation, expires_at, data = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        return generation, pickle.loads(data)
+
+    def set(self, key, generation, token):
+        entry = (generation, time.monotonic() + self.timeout, pickle.dumps(token))
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+local_tokens = LocalTokenCache(settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """与TokenAuthentication相同，令牌查询结果缓存AUTH_TOKEN_CACHE_TIMEOUT秒"""
+
+    def authenticate_credentials(self, key):
+        token = self.get_cached(key)
+        if token is None:
+            token = Token.objects.select_related('user').filter(key=key).first()
+            if token is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            generation = get_user_generation(token.user_id)
+            # 令牌已被撤销时add不会覆盖撤销标记
+            cache.add(_token_key(key), (generation, token), settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            local_tokens.set(key, generation, token)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return (token.user, token)
+
+    def get_cached(self, key):
+        """先查进程内缓存，再查共享缓存；记录的版本号与用户当前版本号不一致时视为未命中"""
+        entry = local_tokens.get(key)
+        if entry is not None:
+            generation, token = entry
+            if generation == get_user_generation(token.user_id):
+                return token
+        entry = cache.get(_token_key(key))
+        if entry is None or entry == REVOKED:
+            return None
+        generation, token = entry
+        if generation != get_user_generation(token.user_id):
+            return None
+        local_tokens.set(key, generation, token)
+        return token
+
+def update_cached_token(token):
+    """只更新了last_login等不影响认证的字段时，用当前的令牌对象覆盖缓存，不使缓存失效"""
+    if not isinstance(token, Token):
+        return
+    key = _token_key(token.key)
+    generation = get_user_generation(token.user_id)
+    if cache.get(key) != REVOKED:
+        cache.set(key, (generation, token), settings.AUTH_TOKEN_CACHE_TIMEOUT)
+    local_tokens.set(token.key, generation, token)
+
+def invalidate_user(user_id):
+    """用户信息变化（修改密码、资料，停用、删除）后使其令牌的缓存失效，在事务提交后执行"""
+    transaction.on_commit(lambda: _bump_user_generation(user_id))
+
+def revoke_tokens(user):
+    """删除用户的令牌（登出、修改密码），缓存同时失效"""
+    tokens = Token.objects.filter(user=user)
+    keys = list(tokens.values_list('key', flat=True))
+    tokens.delete()
+    def invalidate():
+        cache.set_many({_token_key(key): REVOKED for key in keys}, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        _bump_user_generation(user.pk)
+    transaction.on_commit(invalidate)
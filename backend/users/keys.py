@@ -0,0 +1,93 @@
+import base64
+import os
+import threading
+import rsa
+from django.conf import settings
+
+try:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+except ImportError:  # 未安装cryptography时使用纯Python的rsa库
+    serialization = None
+
+class RsaBackend:
+    """纯Python实现的rsa库"""
+    name = 'rsa'
+
+    def load_private_key(self, data):
+        return rsa.PrivateKey.load_pkcs1(data)
+
+    def decrypt(self, ciphertext, private_key):
+        return rsa.decrypt(ciphertext, private_key)
+
+class CryptographyBackend:
+    """基于OpenSSL的cryptography库（使用CRT加速），解密与rsa库相同的PKCS#1 v1.5密文"""
+    name = 'cryptography'
+
+    def load_private_key(self, data):
+        return serialization.load_pem_private_key(data, password=None)
+
+    def decrypt(self, ciphertext, private_key):
+        return private_key.decrypt(ciphertext, padding.PKCS1v15())
+
+BACKENDS = {
+    RsaBackend.name: RsaBackend,
+    CryptographyBackend.name: CryptographyBackend,
+}
+
+def available_backends():
+    """当前环境可用的解密后端名称"""
+    names = [RsaBackend.name]
+    if serialization is not None:
+        names.insert(0, CryptographyBackend.name)
+    return names
+
+def get_backend(name=None):
+    """按名称获取解密后端；auto时优先使用cryptography"""
+    name = name or settings.RSA_DECRYPT_BACKEND
+    if name == 'auto':
+        name = available_backends()[0]
+    if name not in available_backends():
+        raise ValueError(f'RSA解密后端不可用: {name}')
+    return BACKENDS[name]()
+
+# 每个worker进程只读取、解析一次密钥文件；
+# 开启RSA_KEY_RELOAD时每次使用前比较文件修改时间，密钥文件被替换后自动重新加载
+_lock = threading.Lock()
+_cache = {}  # (文件路径, 解析方式) -> (修改时间, 解析结果)
+
+def _load(path, parse, kind):
+    key = (path, kind)
+    entry = _cache.get(key)
+    if entry is not None and not settings.RSA_KEY_RELOAD:
+        return entry[1]
+    mtime = os.stat(path).st_mtime_ns
+    if entry is not None and entry[0] == mtime:
+        return entry[1]
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None or entry[0] != mtime:
+            with open(path, 'rb') as f:
+                entry = (mtime, parse(f.read()))
+            _cache[key] = entry
+    return entry[1]
+
+def get_private_key(backend=None):
+    """获取指定解密后端格式的RSA私钥"""
+    backend = backend or get_backend()
+    return _load(settings.RSA_PRIVATE_KEY_PATH, backend.load_private_key, backend.name)
+
+def get_public_key_pem():
+    """获取PEM格式的RSA公钥文本"""
+    return _load(settings.RSA_PUBLIC_KEY_PATH, lambda data: data.decode('utf-8'), 'pem')
+
+def decrypt(encrypted, backend=None):
+    """解码前端提交的base64密文并用私钥解密"""
+    backend = backend or get_backend()
+    ciphertext = base64.b64decode(encrypted)
+    return backend.decrypt(ciphertext, get_private_key(backend)).decode('utf-8')
+
+def clear_cache():
+    """清空已加载的密钥，下次使用时重新读取文件"""
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,133 @@
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.header import Header
+from email.mime.text import MIMEText
+from django.conf import settings
+from django.db import close_old_connections
+from .models import VerificationCode
+
+logger = logging.getLogger(__name__)
+
+class MailQueue:
+    """邮件发送队列
+
+    请求线程只负责入队并立即返回；每个worker进程内的后台线程依次发送，
+    复用同一个已完成STARTTLS和登录的SMTP连接，空闲一段时间后断开。
+    临时错误按指数退避重试，最终仍失败时调用任务的on_failure回调。
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.server = None
+
+    def enqueue(self, recipient, message, on_failure=None):
+        self.ensure_worker()
+        self.queue.put((recipient, message, on_failure))
+
+    def ensure_worker(self):
+        """按需启动后台线程；fork出的子进程中需要重新启动"""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.server = None
+            self.thread = threading.Thread(target=self.run, name='mail-queue', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                job = self.queue.get(timeout=settings.EMAIL_CONNECTION_IDLE_TIMEOUT)
+            except queue.Empty:
+                self.close()
+                continue
+            try:
+                self.process(*job)
+            except Exception:
+                logger.exception('邮件发送任务异常')
+            finally:
+                close_old_connections()
+                self.queue.task_done()
+
+    def process(self, recipient, message, on_failure):
+        attempts = settings.EMAIL_SEND_MAX_RETRIES + 1
+        for attempt in range(attempts):
+            try:
+                self.connection().sendmail(settings.DEFAULT_FROM_EMAIL, recipient, message.as_string())
+                return
+            except smtplib.SMTPResponseException as e:
+                self.close()
+                # 5xx为永久性错误，不再重试
+                if e.smtp_code >= 500:
+                    logger.warning('发送邮件到%s失败: %s', recipient, e)
+                    break
+                logger.info('发送邮件到%s遇到临时错误(第%d次): %s', recipient, attempt + 1, e)
+            except smtplib.SMTPServerDisconnected as e:
+                self.close()
+                logger.info('发送邮件到%s遇到临时错误(第%d次): %s', recipient, attempt + 1, e)
+            except smtplib.SMTPException as e:
+                # 收件人被拒绝等其他SMTP错误，不再重试
+                self.close()
+                logger.warning('发送邮件到%s失败: %s', recipient, e)
+                break
+            except OSError as e:
+                # 网络错误，重试前会重新建立连接
+                self.close()
+                logger.info('发送邮件到%s遇到临时错误(第%d次): %s', recipient, attempt + 1, e)
+            if attempt + 1 < attempts:
+                time.sleep(settings.EMAIL_SEND_RETRY_DELAY * 2 ** attempt)
+        if on_failure:
+            on_failure()
+
+    def connection(self):
+        """返回可用的SMTP连接，已有连接失效时重新连接并登录"""
+        if self.server is not None:
+            try:
+                if self.server.noop()[0] == 250:
+                    return self.server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.close()
+        server = smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT, timeout=settings.EMAIL_TIMEOUT)
+        try:
+            if settings.EMAIL_USE_TLS:
+                # 启用TLS加密
+                server.starttls()
+            if settings.EMAIL_HOST_PASSWORD:
+                # 登录邮箱
+                server.login(settings.DEFAULT_FROM_EMAIL, settings.EMAIL_HOST_PASSWORD)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+        return server
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            self.server.close()
+        self.server = None
+
+mail_queue = MailQueue()
+
+def send_verification_code(email, verification_code):
+    """将验证码邮件放入发送队列，最终发送失败时删除验证码"""
+    sender_email = settings.DEFAULT_FROM_EMAIL
+    subject = 'hetaoshu verification code'
+    message = f'{verification_code.code}. Valid in 60 minutes.'
+    msg = MIMEText(message, 'plain')
+    msg['From'] = Header(sender_email)
+    msg['To'] = Header(email)
+    msg['Subject'] = Header(subject)
+    code_id = verification_code.pk
+    mail_queue.enqueue(email, msg, on_failure=lambda: VerificationCode.objects.filter(pk=code_id).delete())
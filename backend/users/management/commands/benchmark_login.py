@@ -0,0 +1,45 @@
+import base64
+import os
+import tempfile
+import time
+import rsa
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from users import keys
+from users.serializers import LoginSerializer
+
+class Command(BaseCommand):
+    help = '测量单核上登录序列化器校验（RSA解密密码）的吞吐量，对比各解密后端，使用临时生成的密钥对'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='每种模式的校验次数')
+        parser.add_argument('--key-size', type=int, default=2048, help='临时密钥长度')
+
+    def handle(self, *args, **options):
+        public_key, private_key = rsa.newkeys(options['key_size'])
+        with tempfile.TemporaryDirectory() as key_dir:
+            private_path = os.path.join(key_dir, 'private.pem')
+            public_path = os.path.join(key_dir, 'public.pem')
+            with open(private_path, 'wb') as f:
+                f.write(private_key.save_pkcs1())
+            with open(public_path, 'wb') as f:
+                f.write(public_key.save_pkcs1())
+            password = base64.b64encode(rsa.encrypt(b'benchmark-password', public_key)).decode('ascii')
+            data = {'student_id': 'bench', 'password': password}
+            for backend in keys.available_backends():
+                with override_settings(RSA_PRIVATE_KEY_PATH=private_path, RSA_PUBLIC_KEY_PATH=public_path, RSA_DECRYPT_BACKEND=backend):
+                    # 每次都重新读取并解析私钥，即改造前的行为
+                    self.report(f'{backend}, reload key per request', options['iterations'], data, keys.clear_cache)
+                    keys.clear_cache()
+                    self.report(f'{backend}, cached key', options['iterations'], data)
+                keys.clear_cache()
+
+    def report(self, label, iterations, data, before_each=None):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            if before_each:
+                before_each()
+            serializer = LoginSerializer(data=data)
+            serializer.is_valid(raise_exception=True)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'{label:<42} {iterations / elapsed:8.1f} validations/s  {elapsed / iterations * 1000:7.2f} ms/validation')
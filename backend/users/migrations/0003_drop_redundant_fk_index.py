@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# 这些外键已有以其列开头的复合索引，查询和外键约束（MySQL要求外键列上有索引）都可以使用复合索引，
+# 单列索引只增加写入和存储开销
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_verificationcode_lookup_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='verificationcode',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='verification_codes', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
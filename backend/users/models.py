@@ -5,6 +5,7 @@ import random
 import string
 from datetime import timedelta
 from django.utils import timezone
+from . import authentication
 
 # 生成验证码过期时间的函数 - 这个函数将在数据库层面提供默认值
 def get_default_expires_at():
@@ -41,6 +42,19 @@ class User(AbstractBaseUser, PermissionsMixin):
     
     def __str__(self):
         return self.student_id
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        # 缓存的令牌认证结果中带有用户对象，用户信息变化后需要失效；QuerySet.update不经过这里。
+        # 登录时只更新last_login，不使缓存失效，缓存中的last_login最多滞后AUTH_TOKEN_CACHE_TIMEOUT秒
+        update_fields = kwargs.get('update_fields')
+        if not adding and not (update_fields is not None and set(update_fields) <= {'last_login'}):
+            authentication.invalidate_user(self.pk)
+
+    def delete(self, *args, **kwargs):
+        authentication.invalidate_user(self.pk)
+        return super().delete(*args, **kwargs)
     
     class Meta:
         verbose_name = '用户'
@@ -48,7 +62,8 @@ class User(AbstractBaseUser, PermissionsMixin):
 
 class VerificationCode(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='verification_codes')
+    # 由verificationcode_lookup_idx代替单列索引
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='verification_codes', db_index=False)
     code = models.CharField(max_length=6)
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField(default=get_default_expires_at)
@@ -66,3 +81,7 @@ class VerificationCode(models.Model):
     class Meta:
         verbose_name = '验证码'
         verbose_name_plural = '验证码'
+        indexes = [
+            # 设置密码时按用户和验证码查找未使用、未过期的记录
+            models.Index(fields=['user', 'code', 'is_used', 'expires_at'], name='verificationcode_lookup_idx'),
+        ]
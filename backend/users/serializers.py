@@ -1,8 +1,6 @@
 from rest_framework import serializers
-from django.conf import settings
 from .models import User, VerificationCode
-import rsa
-import base64
+from . import keys
 
 
 
@@ -23,13 +21,8 @@ class LoginSerializer(serializers.Serializer):
         if not student_id or not encrypted_password:
             raise serializers.ValidationError('请提供学号和密码')
         try:
-            # 加载RSA私钥
-            with open(settings.RSA_PRIVATE_KEY_PATH, 'rb') as f:
-                private_key = rsa.PrivateKey.load_pkcs1(f.read())
-            # 解码base64并解密
-            encrypted_bytes = base64.b64decode(encrypted_password)
-            decrypted_password = rsa.decrypt(encrypted_bytes, private_key).decode('utf-8')
-            data['password'] = decrypted_password
+            # 解码base64并用缓存的私钥解密
+            data['password'] = keys.decrypt(encrypted_password)
         except Exception as e:
             raise serializers.ValidationError('密码解密失败')
         return data
@@ -48,19 +41,9 @@ class VerificationCodeSerializer(serializers.Serializer):
             raise serializers.ValidationError('请提供学号、验证码和密码')
         
         try:
-            with open(settings.RSA_PRIVATE_KEY_PATH, 'rb') as f:
-                private_key = rsa.PrivateKey.load_pkcs1(f.read())
-            
-            # 解密验证码
-            code_bytes = base64.b64decode(encrypted_code)
-            decrypted_code = rsa.decrypt(code_bytes, private_key).decode('utf-8')
-            
-            # 解密密码
-            password_bytes = base64.b64decode(encrypted_password)
-            decrypted_password = rsa.decrypt(password_bytes, private_key).decode('utf-8')
-            
-            data['code'] = decrypted_code
-            data['password'] = decrypted_password
+            # 解密验证码和密码
+            data['code'] = keys.decrypt(encrypted_code)
+            data['password'] = keys.decrypt(encrypted_password)
             data['student_id'] = student_id
             
         except Exception as e:
@@ -79,14 +62,8 @@ class ChangePasswordSerializer(serializers.Serializer):
         if not current_password or not new_password:
             raise serializers.ValidationError('请提供当前密码和新密码')
         try:
-            with open(settings.RSA_PRIVATE_KEY_PATH, 'rb') as f:
-                private_key = rsa.PrivateKey.load_pkcs1(f.read())
-            encrypted_bytes = base64.b64decode(current_password)
-            decrypted_password = rsa.decrypt(encrypted_bytes, private_key).decode('utf-8')
-            encrypted_bytes_new = base64.b64decode(new_password)
-            decrypted_password_new = rsa.decrypt(encrypted_bytes_new, private_key).decode('utf-8')
-            data['current_password'] = decrypted_password
-            data['new_password'] = decrypted_password_new
+            data['current_password'] = keys.decrypt(current_password)
+            data['new_password'] = keys.decrypt(new_password)
         except Exception as e:
             raise serializers.ValidationError('密码解密失败')
         return data
\ No newline at end of file
@@ -0,0 +1,89 @@
+import asyncio
+import socket
+import threading
+import time
+from aiosmtpd.controller import Controller
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from users.mail import mail_queue
+from users.models import User, VerificationCode
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class RecordingHandler:
+    """本地SMTP服务的处理器：记录收到的邮件；release未设置时暂缓应答，replies中的应答依次用于前几封邮件"""
+
+    def __init__(self):
+        self.messages = []
+        self.release = threading.Event()
+        self.release.set()
+        self.replies = []
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.get_running_loop().run_in_executor(None, self.release.wait, 5)
+        if self.replies:
+            return self.replies.pop(0)
+        self.messages.append(envelope)
+        return '250 Message accepted for delivery'
+
+class SendVerificationCodeTests(TransactionTestCase):
+    """邮件由后台线程发送，数据库操作在另一个连接中进行，因此使用TransactionTestCase"""
+
+    def setUp(self):
+        self.handler = RecordingHandler()
+        port = free_port()
+        self.controller = Controller(self.handler, hostname='127.0.0.1', port=port)
+        self.controller.start()
+        self.addCleanup(self.controller.stop)
+        settings = override_settings(
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=port, EMAIL_USE_TLS=False, EMAIL_HOST_PASSWORD='',
+            DEFAULT_FROM_EMAIL='noreply@example.com', EMAIL_SEND_RETRY_DELAY=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # 测试结束后SMTP服务随之停止，丢弃保留的连接
+        self.addCleanup(mail_queue.close)
+        self.client = APIClient()
+
+    def send_code(self, student_id):
+        return self.client.post('/api/users/send-code/', {'student_id': student_id})
+
+    def test_delivered_without_blocking_request(self):
+        # SMTP服务暂不应答，请求仍应立即返回
+        self.handler.release.clear()
+        started = time.monotonic()
+        response = self.send_code('20240001')
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(self.handler.messages, [])
+
+        self.handler.release.set()
+        self.assertTrue(wait_for(lambda: self.handler.messages))
+        envelope = self.handler.messages[0]
+        self.assertEqual(envelope.rcpt_tos, ['20240001@slai.edu.cn'])
+        code = VerificationCode.objects.get(user__student_id='20240001')
+        self.assertIn(code.code, envelope.content.decode())
+
+    def test_transient_error_retried(self):
+        self.handler.replies = ['451 Try again later']
+        self.assertEqual(self.send_code('20240002').status_code, 200)
+        self.assertTrue(wait_for(lambda: self.handler.messages))
+        self.assertTrue(VerificationCode.objects.filter(user__student_id='20240002').exists())
+
+    def test_permanent_error_deletes_code(self):
+        self.handler.replies = ['550 Mailbox unavailable']
+        self.assertEqual(self.send_code('20240003').status_code, 200)
+        user = User.objects.get(student_id='20240003')
+        self.assertTrue(wait_for(lambda: not VerificationCode.objects.filter(user=user).exists()))
+        self.assertEqual(self.handler.messages, [])
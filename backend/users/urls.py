@@ -16,16 +16,26 @@ from rest_framework.permissions import AllowAny
 from rest_framework.decorators import permission_classes
 from users.models import User
 from posts.serializers import ThemeSerializer
+from posts.pagination import FeedPagination
 from rest_framework.permissions import IsAuthenticated
+from hetaoshu.metrics import query_budget
 
+# 认证、用户、主题和图片预取各一次，页码分页多一次COUNT
+@query_budget(5)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_user_posts(request, user_id):
     """获取指定用户的所有帖子"""
     user = get_object_or_404(User, id=user_id)
-    themes= user.themes.filter(is_active=True).order_by('-created_at')
-    serializer = ThemeSerializer(themes, many=True)
-    return Response(serializer.data)
+    themes= user.themes.filter(is_active=True).for_feed().order_by('-created_at')
+    paginator = FeedPagination()
+    # 不带分页参数时返回完整列表，兼容旧版前端
+    if not any(param in request.query_params for param in (paginator.cursor_query_param, paginator.page_query_param, paginator.page_size_query_param)):
+        serializer = ThemeSerializer(themes, many=True, context={'request': request, 'list': True})
+        return Response(serializer.data)
+    paginated_themes = paginator.paginate_queryset(themes, request)
+    serializer = ThemeSerializer(paginated_themes, many=True, context={'request': request, 'list': True})
+    return paginator.get_paginated_response(serializer.data)
 
 urlpatterns = [
     path('send-code/', SendVerificationCodeView.as_view(), name='send_verification_code'),
@@ -8,11 +8,10 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authtoken.models import Token
 from .models import User, VerificationCode
 from .serializers import UserSerializer, LoginSerializer, VerificationCodeSerializer,ChangePasswordSerializer
-from django.core.mail import send_mail
+from . import keys
+from . import mail
+from .authentication import revoke_tokens
 from django.conf import settings
-import smtplib
-from email.mime.text import MIMEText
-from email.header import Header
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
@@ -22,8 +21,7 @@ from rest_framework.permissions import AllowAny
 def get_public_key(request):
     """提供公钥给前端"""
     try:
-        with open(settings.RSA_PUBLIC_KEY_PATH, 'rb') as f:
-            public_key = f.read().decode('utf-8')
+        public_key = keys.get_public_key_pem()
         return Response({
             'publicKey': public_key
         },status=status.HTTP_200_OK)
@@ -60,37 +58,12 @@ class SendVerificationCodeView(APIView):
         # 生成验证码，明确设置expires_at的值
         verification_code = VerificationCode.objects.create(user=user, expires_at=timezone.now() + timedelta(minutes=60))
         
-        sender_email = settings.DEFAULT_FROM_EMAIL 
-        sender_password = settings.EMAIL_HOST_PASSWORD
-        smtp_server = settings.EMAIL_HOST
-        smtp_port = settings.EMAIL_PORT
-
-        # 发送邮件
-        subject = 'hetaoshu verification code'
-        message = f'{verification_code.code}. Valid in 60 minutes.'
-
-
-        msg = MIMEText(message, 'plain')
-        msg['From'] = Header(sender_email)
-        msg['To'] = Header(email)  # 用分号分隔多个收件人
-        msg['Subject'] = Header(subject)
-        try:
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                # 启用TLS加密
-                server.starttls()
-                # 登录邮箱
-                server.login(sender_email, sender_password)
-                
-                # 发送邮件（将所有收件人作为列表传入）
-                server.sendmail(sender_email, email, msg.as_string())
-            
-            return Response({
-                'message': '验证码已发送到你的邮箱',
-                'student_id': student_id
-            }, status=status.HTTP_200_OK)
-        except Exception as e:
-            verification_code.delete()  # 发送失败，删除验证码
-            return Response({'error': f'发送邮件失败: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # 邮件由后台线程异步发送，最终发送失败时会删除验证码
+        mail.send_verification_code(email, verification_code)
+        return Response({
+            'message': '验证码已发送到你的邮箱',
+            'student_id': student_id
+        }, status=status.HTTP_200_OK)
 
 class VerifyCodeAndSetPasswordView(APIView):
     permission_classes = [AllowAny]
@@ -163,8 +136,8 @@ class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
-        # 删除token实现登出
-        request.user.auth_token.delete()
+        # 删除token实现登出，缓存的认证结果同时失效
+        revoke_tokens(request.user)
         return Response({'message': '成功登出'}, status=status.HTTP_200_OK)
 
 class UserDetailView(generics.RetrieveAPIView):
@@ -202,8 +175,8 @@ class ChangePasswordView(APIView):
             # 更新密码
             user.set_password(new_password)
             user.save()
-             # 重新生成token（可选，增强安全性）
-            Token.objects.filter(user=user).delete()
+             # 重新生成token（可选，增强安全性），旧token立即失效
+            revoke_tokens(user)
             token, created = Token.objects.get_or_create(user=user)
             return Response({
                 'message': '密码修改成功',
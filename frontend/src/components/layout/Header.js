@@ -1,5 +1,5 @@
 import { Link } from 'react-router-dom';
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 
 const Header = ({ user }) => {
@@ -7,6 +7,8 @@ const Header = ({ user }) => {
   const [displayName, setDisplayName] = useState('');
   const [unreadCount, setUnreadCount] = useState(0);
   const [messages, setMessages] = useState([]);
+  // 已计入未读数的消息ID，SSE补发或重连时可能收到已有的消息
+  const seenIds = useRef(new Set());
 
   useEffect(() => {
     if (user) {
@@ -23,7 +25,8 @@ const Header = ({ user }) => {
       // 请求用户没有读到的回复的列表
       if(user){
         axios.get('/messages/').then(res => {
-            setUnreadCount(res.data.length);
+            res.data.forEach(item => seenIds.current.add(item.id));
+            setUnreadCount(seenIds.current.size);
             setMessages(res.data);
           
         }).catch(err => {
@@ -33,6 +36,60 @@ const Header = ({ user }) => {
     }
   }, [user]);
 
+  // 通过SSE接收新回复，不再轮询消息接口；服务端不支持时（如开发环境的runserver）只在登录时获取一次。
+  // 连接使用一次性凭证而不是登录令牌，断线后重新获取凭证再连接，并用last_event_id补发断线期间的消息
+  useEffect(() => {
+    if (!user || !localStorage.getItem('token') || !window.EventSource) {
+      return undefined;
+    }
+    let source = null;
+    let timer = null;
+    let closed = false;
+    let lastEventId = null;
+
+    const connect = () => {
+      axios.post('/events/ticket/').then(res => {
+        if (closed) {
+          return;
+        }
+        const params = new URLSearchParams({ ticket: res.data.ticket });
+        if (lastEventId) {
+          params.set('last_event_id', lastEventId);
+        }
+        source = new EventSource(`${axios.defaults.baseURL}/events/?${params}`);
+        source.addEventListener('reply', event => {
+          lastEventId = event.lastEventId || lastEventId;
+          const message = JSON.parse(event.data);
+          if (seenIds.current.has(message.id)) {
+            return;
+          }
+          seenIds.current.add(message.id);
+          setMessages(prev => [message, ...prev]);
+          setUnreadCount(prev => prev + 1);
+        });
+        source.onerror = () => {
+          // 凭证只能使用一次，浏览器自动重连会被拒绝；连接关闭后稍后用新凭证重连
+          if (source.readyState === EventSource.CLOSED && !closed) {
+            source.close();
+            timer = setTimeout(connect, 5000);
+          }
+        };
+      }).catch(err => {
+        // 令牌失效或接口不存在时不再连接
+        console.error('获取通知连接凭证失败:', err);
+      });
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(timer);
+      if (source) {
+        source.close();
+      }
+    };
+  }, [user]);
+
   return (
     <header className="bg-white  fixed top-0 left-0 right-0 z-50">
       <div className="container mx-auto max-w-[1200px] px-4">
@@ -60,7 +60,7 @@ const CommentForm = ({ replyToComment , onCommentSuccess, isVisible = true }) =>
       setImages([]);
     } catch (error) {
       console.error('发表评论失败:', error);
-      toast.error(error.response?.data?.error || '发表评论失败，请稍后重试');
+      toast.error(error.response?.data?.error || error.response?.data?.detail || '发表评论失败，请稍后重试');
     } finally {
       setLoading(false);
     }
@@ -10,10 +10,10 @@ const PostCard = ({ theme}) => {
     <div className='post-card'>
       {/* 根据image_count决定显示图片还是摘要 */}
       {theme.image ? (
-        // 有图片时直接使用first_image
+        // 有图片时优先使用缩略图，缩略图尚未生成时使用原图
         <div className='post-image-container' >
        <img
-          src={theme.image.image} 
+          src={theme.image.variants?.thumb?.webp?.url || theme.image.image} 
           alt={theme.title}
           className='post-image'
         />
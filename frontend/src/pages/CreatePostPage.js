@@ -50,7 +50,7 @@ const CreatePostPage = () => {
       navigate(`/themes/${response.data.id}`);
     } catch (error) {
       console.error('发布帖子失败:', error);
-      toast.error(error.response?.data?.error || '发布帖子失败，请稍后重试');
+      toast.error(error.response?.data?.error || error.response?.data?.detail || '发布帖子失败，请稍后重试');
     } finally {
       setLoading(false);
     }